@@ -4,34 +4,113 @@ With advanced features, improved UI, and expanded capabilities
 """
 
 # ===== Imports =====
-import streamlit as st
-import random, json, time, logging, asyncio
-from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass
+import random, json, time, logging, hashlib, threading, os, uuid, tempfile, mmap, struct, sys, re, math, importlib
+from typing import Any, List, Dict, Optional, Tuple, Callable, Mapping, Sequence, Iterator, Iterable, Collection
+from collections import OrderedDict, Counter
+from array import array
+from itertools import islice, chain
+from heapq import heappush, heapreplace, nlargest
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+from functools import wraps, lru_cache
 from enum import Enum
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
-import plotly.graph_objects as go
-import plotly.express as px
-import pandas as pd
-import numpy as np
-from streamlit_option_menu import option_menu
-import qrcode
-from io import BytesIO
-import base64
+from io import BytesIO, StringIO
+
+class _LazyModule:
+    """Stands in for a module and imports it on first attribute access"""
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+# UI and numeric dependencies load on first use, so the core (QuantumSearch, LLM,
+# Chatbot, the HTTP service) imports without them and worker processes start fast
+st = _LazyModule("streamlit")
+go = _LazyModule("plotly.graph_objects")
+px = _LazyModule("plotly.express")
+pd = _LazyModule("pandas")
+np = _LazyModule("numpy")
+qrcode = _LazyModule("qrcode")
+asyncio = _LazyModule("asyncio")
+futures = _LazyModule("concurrent.futures")
+
+def option_menu(*args, **kwargs):
+    from streamlit_option_menu import option_menu as menu
+    return menu(*args, **kwargs)
+
+def cache_resource(**kwargs):
+    """
+    `st.cache_resource` when running under Streamlit (the script is re-executed
+    on every rerun, so process-wide objects must live in its cache); a plain
+    in-process memo otherwise, so importing the core never pulls in Streamlit.
+    """
+    def decorate(fn):
+        if "streamlit" in sys.modules:
+            return st.cache_resource(**kwargs)(fn)
+        return lru_cache(maxsize=kwargs.get("max_entries"))(fn)
+    return decorate
 
 # ===== Config =====
 CONFIG = {
     "APP_TITLE": "Quantum AI Assistant Pro",
     "APP_ICON": "⚛️",
     "CHAT_HEIGHT": 500,
+    "CHAT_PAGE_SIZE": 20,  # Messages added per "Load older messages" click
     "MAX_SOLUTIONS": 8,
-    "SIMULATION_DELAY": 0.4,
-    "PROGRESS_STEPS": 100,
     "KB_FILE": "knowledge_base.json",
-    "HISTORY_FILE": "chat_history.json",
+    "KB_LOG_COMPACT_BYTES": 256 * 1024,  # Fold the KB upsert log into the snapshot past this size
+    "KB_COMPILED_SUFFIX": ".qkb",  # Memory-mapped binary KB built by `python Qapp.py compile-kb`
+    "KB_SHARED": False,  # Workers attach the KB published by `python Qapp.py kb-loader` instead of loading a copy each
+    "KB_SHARED_POLL": 1.0,  # Seconds between the loader's checks for KB changes
+    "HISTORY_DIR": "chat_history",  # One append-only JSON Lines log per conversation
     "QUANTUM_RANDOMNESS_FACTOR": 0.15,
+    "QUANTUM_MODE": "live",  # "live" (fresh noise per call) or "deterministic" (seeded hash noise)
+    "QUANTUM_SEED": 42,
     "MIN_SIMILARITY_THRESHOLD": 0.1,
+    "SEARCH_BACKEND": "index",  # "index" (inverted index), "numpy" (vectorized), "bm25" (titles + solutions) or "semantic" (embeddings)
+    "FUZZY_MATCHING": True,  # Map unknown query words to their closest topic word (trigram index)
+    "FUZZY_MIN_SIMILARITY": 0.5,  # Minimum trigram Dice similarity for a correction
+    "FUZZY_MAX_CANDIDATES": 2000,  # Most vocabulary words compared per correction, rarest trigrams first (None = all)
+    "FUZZY_CACHE_SIZE": 4096,  # Corrections memoized per process
+    "BM25_K1": 1.2,
+    "BM25_B": 0.75,
+    "BM25_TITLE_WEIGHT": 3,  # Topic title words count this many times toward term frequency
+    "SEMANTIC_DIM": 256,  # Hashed embedding width (power of two)
+    "SEMANTIC_SEED": 7,  # Feature hashing and k-means sampling seed
+    "SEMANTIC_TITLE_WEIGHT": 3,
+    "SEMANTIC_CANDIDATES": 200,  # Best-scoring topics handed to ranking
+    "SEMANTIC_EXACT_MAX": 50_000,  # Up to this many topics, score all of them instead of probing the IVF index
+    "SEMANTIC_IVF_LISTS": None,  # k-means lists in the ANN index (None = 2 * sqrt(topics))
+    "SEMANTIC_NPROBE": 32,  # Lists scanned per query
+    "SEMANTIC_LEXICON": str(Path(__file__).with_name("semantic_lexicon.json")),  # Word -> concept map and stop words
+    "CANDIDATE_BUDGET": None,  # Most candidates a query's generation stage passes on (None = every match)
+    "SEARCH_RERANKER": None,  # Optional re-rank stage after scoring: "semantic" (None = off)
+    "RERANK_CANDIDATES": 200,  # Best scored topics handed to the re-ranker
+    "RERANK_WEIGHT": 0.5,  # Re-ranked score = (1 - w) * first-stage score + w * re-ranker score
+    "BATCH_CHUNK_SIZE": 256,  # Queries scored together by `search_many` (and sent to a worker at once)
+    "BATCH_POOL_THRESHOLD": 20000,  # Batches at least this large fan out to a process pool
+    "BATCH_WORKERS": None,  # Pool size (None = CPU count)
+    "SERVICE_HOST": "127.0.0.1",  # `python Qapp.py serve` JSON API
+    "SERVICE_PORT": 8000,
+    "SERVICE_WORKERS": 1,  # Search processes behind the API (1 = one in-process search thread)
+    "SERVICE_MAX_BODY": 64 * 1024,
+    "ANALYTICS_CAPACITY": 100_000,  # Searches kept for analytics (ring buffer)
+    "TRENDING_WINDOW": 20,  # Trending queries are counted over the most recent N searches
+    "TRACING": True,  # Per-span latency histograms (see Analytics)
+    "TRACE_PROFILE_RATE": 0.0,  # Fraction of chat turns run under cProfile
+    "METRICS_FILE": None,  # Prometheus textfile to rewrite every METRICS_INTERVAL seconds (None = off)
+    "METRICS_INTERVAL": 15,
+    "CACHE_SIZE": 512,  # Response cache entries (0 disables caching)
+    "CACHE_TTL": 600,  # Seconds before a cached response is recomputed
+    "APP_URL": "https://quantum-ai-assistant.streamlit.app",
+    "QR_CACHE_DIR": ".qr_cache",  # On-disk QR PNG cache (None keeps it in memory only)
     "THEMES": ["Light", "Dark", "Quantum Blue", "Cyberpunk"],
     "LANGUAGES": ["English", "Spanish", "French", "German", "Japanese"],
 }
@@ -133,16 +212,223 @@ class Message:
     content: str
     timestamp: str
     priority: Optional[Priority] = None
-    helpful: Optional[bool] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
 
 class ComingSoon(NotImplementedError):
     pass
 
+# ===== Metrics =====
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _metric_value(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return str(v) if isinstance(v, int) else repr(float(v))
+
+class _Metric:
+    """A named metric family; one value per combination of label values"""
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[k]) for k in self.label_names)
+
+    def _labels(self, key: Tuple[str, ...], extra: Sequence[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if not pairs:
+            return ""
+        escape = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            values = dict(self.values)
+        if not values and not self.label_names:
+            values = {(): 0}
+        return [f"{self.name}{self._labels(key)} {_metric_value(v)}" for key, v in values.items()]
+
+class CounterMetric(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class GaugeMetric(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+class HistogramMetric(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            values = {key: (list(counts), total, n) for key, (counts, total, n) in self.values.items()}
+        lines = []
+        for key, (counts, total, n) in values.items():
+            cumulative = 0
+            for bound, c in zip(self.buckets + (math.inf,), counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{self._labels(key, [('le', _metric_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_metric_value(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {n}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms rendered in the Prometheus text exposition
+    format. Registering an existing name returns the existing metric, so
+    module-level definitions survive Streamlit reruns.
+    """
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, _Metric] = {}
+
+    def _register(self, cls, name: str, help: str, labels: Sequence[str], **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labels, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> CounterMetric:
+        return self._register(CounterMetric, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> GaugeMetric:
+        return self._register(GaugeMetric, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> HistogramMetric:
+        return self._register(HistogramMetric, name, help, labels, buckets=buckets)
+
+    def exposition(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+    def write(self, file: str):
+        """Dump the exposition atomically, e.g. for node_exporter's textfile collector"""
+        _atomic_write(file, lambda f: f.write(self.exposition().encode("utf8")))
+
+def _dump_metrics(registry: MetricsRegistry, file: str, interval: float):
+    while True:
+        time.sleep(interval)
+        try:
+            registry.write(file)
+        except OSError as e:
+            log.warning(f"Metrics dump failed: {e}")
+
+@cache_resource(show_spinner=False)
+def get_metrics() -> MetricsRegistry:
+    """Process-wide metrics registry; also dumped to METRICS_FILE periodically if set"""
+    registry = MetricsRegistry()
+    if CONFIG["METRICS_FILE"]:
+        threading.Thread(target=_dump_metrics, args=(registry, CONFIG["METRICS_FILE"], CONFIG["METRICS_INTERVAL"]),
+                         name="qai-metrics", daemon=True).start()
+    return registry
+
+def timed(metric: HistogramMetric):
+    """Observe the wall time of every call of the decorated function"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def timed_iter(items: Iterable, observe: Callable[[float], None]) -> Iterator:
+    """`timed` for a stream: `observe` gets the time spent producing its items, not the time the consumer holds it"""
+    items = iter(items)
+    busy = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                busy += time.perf_counter() - start
+            yield item
+    finally:
+        if hasattr(items, "close"):
+            items.close()
+        observe(busy)
+
+METRICS = get_metrics()
+QUERIES = METRICS.counter("qai_queries_total", "Queries answered, by entry point", ["source"])
+ERRORS = METRICS.counter("qai_errors_total", "Failed queries, by exception type", ["type"])
+SEARCHES = METRICS.counter("qai_searches_total", "Searches run, by scoring backend", ["backend"])
+CACHE_LOOKUPS = METRICS.counter("qai_cache_lookups_total", "Response cache lookups", ["result"])
+PROCESS_SECONDS = METRICS.histogram("qai_process_seconds", "Chatbot.process latency")
+FIRST_CHUNK_SECONDS = METRICS.histogram("qai_first_chunk_seconds", "Chatbot.process_stream time to the first reply chunk")
+SEARCH_SECONDS = METRICS.histogram("qai_search_seconds", "Per-query search latency (search, search_many and the HTTP service)")
+KB_TOPICS = METRICS.gauge("qai_kb_topics", "Topics in the last loaded or saved knowledge base")
+KB_LOAD_SECONDS = METRICS.histogram("qai_kb_load_seconds", "load_kb latency")
+KB_SAVE_SECONDS = METRICS.histogram("qai_kb_save_seconds", "save_kb latency")
+KB_ERRORS = METRICS.counter("qai_kb_errors_total", "Knowledge base I/O failures", ["op"])
+
 # ===== Knowledge Base =====
-def load_kb(file: str = CONFIG["KB_FILE"]) -> Dict[str, List[str]]:
+@timed(KB_LOAD_SECONDS)
+def load_kb(file: str = CONFIG["KB_FILE"], prefer_compiled: bool = True) -> Mapping[str, List[str]]:
     """
-    Loads KB or returns default with expanded categories
+    Loads KB or returns default with expanded categories.
+    A compiled KB built from exactly the current JSON KB and logs is used instead.
     """
+    compiled = compiled_kb_path(file)
+    if prefer_compiled and compiled.exists():
+        version = kb_version(file, include_compiled=False)
+        try:
+            kb = CompiledKB(compiled)
+            if version is None or kb.source_version == version:
+                KB_TOPICS.set(len(kb))
+                return kb
+            kb.close()  # Stale: unmap now rather than when the collector breaks its reference cycles
+        except (OSError, ValueError) as e:
+            KB_ERRORS.inc(op="load")
+            log.warning(f"Compiled KB load failed: {e}")
+
     default = {
         # --- Digital / IT ---
         "password reset": [
@@ -313,29 +599,1009 @@ def load_kb(file: str = CONFIG["KB_FILE"]) -> Dict[str, List[str]]:
         ]
     }
 
+    kb = default
     try:
         if Path(file).exists():
-            return json.load(open(file, "r", encoding="utf8"))
+            with open(file, "r", encoding="utf8") as f:
+                kb = json.load(f)
     except Exception as e:
+        KB_ERRORS.inc(op="load")
         log.warning(f"KB load failed: {e}")
-    return default
 
+    # Upserts not yet compacted into the snapshot, oldest first
+    for log_file in _kb_logs(file):
+        _replay_kb_log(kb, log_file)
+    KB_TOPICS.set(len(kb))
+    return kb
+
+def _kb_logs(file: str) -> Tuple[Path, Path]:
+    """(retired, live) upsert logs - the retired one only exists while a compaction runs"""
+    return Path(f"{file}.log.old"), Path(f"{file}.log")
+
+def _replay_kb_log(kb: Dict[str, List[str]], log_file: Path):
+    if not log_file.exists():
+        return
+    try:
+        with open(log_file, "r", encoding="utf8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    log.warning(f"Skipping torn KB log line in {log_file}")
+                    continue
+                if record["solutions"] is None:
+                    kb.pop(record["topic"], None)
+                else:
+                    kb[record["topic"]] = record["solutions"]
+    except Exception as e:
+        log.warning(f"KB log replay failed: {e}")
+
+def compiled_kb_path(file: str = CONFIG["KB_FILE"]) -> Path:
+    return Path(file).with_suffix(CONFIG["KB_COMPILED_SUFFIX"])
+
+def kb_version(file: str = CONFIG["KB_FILE"], include_compiled: bool = True) -> Optional[int]:
+    """
+    Version stamp of the KB: a hash of the mtime and size of each of its files,
+    None while only the default KB exists. Sizes are included because an upsert
+    can land within the filesystem's mtime granularity of the previous write.
+    """
+    paths = [Path(file), *_kb_logs(file)] + ([compiled_kb_path(file)] if include_compiled else [])
+    stamps = []
+    for p in paths:
+        try:
+            stat = p.stat()
+        except OSError:
+            continue
+        stamps.append(f"{p.name}:{stat.st_mtime_ns}:{stat.st_size}")
+    if not stamps:
+        return None
+    return int.from_bytes(hashlib.blake2b("|".join(stamps).encode("utf8"), digest_size=8).digest(), "little")
+
+def _atomic_write(file, write_fn: Callable):
+    """Have `write_fn` fill a binary temp file beside the target, fsync it, then rename it over the target"""
+    path = Path(file)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_fn(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+def _write_json_atomic(data, file):
+    """Write compact JSON atomically (see `_atomic_write`)"""
+    text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    _atomic_write(file, lambda f: f.write(text.encode("utf8")))
+
+@timed(KB_SAVE_SECONDS)
 def save_kb(kb_data: Dict[str, List[str]], file: str = CONFIG["KB_FILE"]):
-    """Save knowledge base to file"""
+    """Save the full knowledge base atomically; it supersedes any pending upserts"""
     try:
-        with open(file, "w", encoding="utf8") as f:
-            json.dump(kb_data, f, indent=2)
+        _write_json_atomic(dict(kb_data), file)
+        for log_file in _kb_logs(file):
+            log_file.unlink(missing_ok=True)
+        KB_TOPICS.set(len(kb_data))
         return True
     except Exception as e:
+        KB_ERRORS.inc(op="save")
         log.error(f"Failed to save KB: {e}")
         return False
 
+def upsert_topic(topic: str, solutions: Optional[List[str]], file: str = CONFIG["KB_FILE"]):
+    """Add or replace one topic (None deletes it) by appending to the KB log"""
+    record = json.dumps({"topic": topic, "solutions": solutions}, ensure_ascii=False, separators=(",", ":"))
+    try:
+        with open(_kb_logs(file)[1], "a", encoding="utf8") as f:
+            f.write(record + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+    except Exception as e:
+        log.error(f"Failed to upsert KB topic: {e}")
+        return False
+    if size > CONFIG["KB_LOG_COMPACT_BYTES"]:
+        compact_kb(file)
+    return True
+
+def compact_kb(file: str = CONFIG["KB_FILE"]):
+    """
+    Fold the upsert log into the snapshot. The live log is retired first, so
+    upserts that arrive during compaction land in a fresh log and are kept.
+    """
+    retired, live = _kb_logs(file)
+    try:
+        if live.exists() and not retired.exists():
+            os.replace(live, retired)
+        _write_json_atomic(dict(load_kb(file, prefer_compiled=False)), file)
+        retired.unlink(missing_ok=True)
+        return True
+    except Exception as e:
+        log.error(f"Failed to compact KB: {e}")
+        return False
+
+# ===== Compiled KB =====
+# Mapped files (the compiled KB, the BM25 sidecar) share one layout: a native byte
+# order header ending with the file offset of every section, then the sections as
+# arrays (8-byte aligned), then one UTF-8 blob holding their strings.
+def _strings(blob: bytearray, items: Iterable[str]) -> array:
+    """Append `items` to a string blob; returns their blob offsets (one more than items)"""
+    offsets = array("Q", [len(blob)])
+    for text in items:
+        blob.extend(text.encode("utf8"))
+        offsets.append(len(blob))
+    return offsets
+
+def _write_mapped(path, header: struct.Struct, fields: Sequence, layout, sections: Dict[str, array], blob: bytes):
+    """Write a mapped file atomically: header (`fields`, then section offsets), `sections` in `layout` order, blob"""
+    body, offsets = bytearray(), []
+    for name, _ in layout:
+        offsets.append(header.size + len(body))
+        body.extend(sections[name].tobytes())
+        body.extend(b"\0" * (-len(body) % 8))
+    offsets.append(header.size + len(body))
+    _atomic_write(path, lambda f: f.writelines((header.pack(*fields, *offsets), body, blob)))
+
+class _MappedFile:
+    """
+    Read-only mmap of a file written by `_write_mapped`. Each section becomes a
+    `_<name>` memoryview read in place, so the pages are shared between every
+    process that maps the same file. Subclasses give the layout and the length
+    of each section (from the header).
+    """
+    MAGIC = b""
+    HEADER = struct.Struct("=4s")
+    SECTIONS: Tuple[Tuple[str, str], ...] = ()
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mm)
+        self._views = [view]
+        try:
+            self.header = self.HEADER.unpack_from(self._mm, 0)
+            if self.header[0] != self.MAGIC:
+                raise ValueError("bad magic")
+            offsets = self.header[-len(self.SECTIONS) - 1:]
+            counts = self._counts()
+            for (name, code), start in zip(self.SECTIONS, offsets):
+                section = view[start:start + counts[name] * array(code).itemsize].cast(code)
+                setattr(self, f"_{name}", section)
+                self._views.append(section)
+        except (struct.error, TypeError, ValueError) as e:
+            self.close()
+            raise ValueError(f"{self.path} is not a {self.MAGIC.decode()} file ({e})") from e
+        self._blob = view[offsets[-1]:]
+        self._views.append(self._blob)
+
+    def _counts(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def _str(self, offsets, i: int) -> str:
+        return str(self._blob[offsets[i]:offsets[i + 1]], "utf8")
+
+    def close(self):
+        """Unmap the file; only while nothing read from it still holds one of its views"""
+        for view in reversed(self._views):
+            view.release()
+        self._mm.close()
+
+_QKB_MAGIC = b"QKB2"
+_QKB_SECTIONS = (
+    ("topic_str", "Q"),    # n_topics + 1 blob offsets of topic names
+    ("topic_sol", "I"),    # n_topics + 1 indexes into sol_str
+    ("topic_sizes", "I"),  # n_topics word-set sizes for Jaccard
+    ("name_order", "I"),   # n_topics topic ids sorted by name, for lookups
+    ("sol_str", "Q"),      # n_solutions + 1 blob offsets of solutions
+    ("token_str", "Q"),    # n_tokens + 1 blob offsets of index tokens (sorted)
+    ("token_post", "Q"),   # n_tokens + 1 indexes into postings
+    ("postings", "I"),     # topic ids per token
+    ("gram_str", "Q"),     # n_grams + 1 blob offsets of token trigrams (sorted), for fuzzy matching
+    ("gram_post", "Q"),    # n_grams + 1 indexes into gram_words
+    ("gram_words", "I"),   # token ids per trigram
+)
+_QKB_HEADER = struct.Struct("=4sIIIIIIIQ" + "Q" * (len(_QKB_SECTIONS) + 1))
+
+def compile_kb(file: str = CONFIG["KB_FILE"], out: Optional[str] = None) -> Path:
+    """Convert the JSON KB (plus pending upserts) into the memory-mapped binary format"""
+    # Stamped before reading, so a write that races the compile leaves it stale rather than lost
+    source_version = kb_version(file, include_compiled=False) or 0
+    kb = load_kb(file, prefer_compiled=False)
+    names = list(kb)
+    blob = bytearray()
+    index: Dict[str, List[int]] = {}
+    sizes = array("I")
+    for tid, p in enumerate(names):
+        p_w = QuantumSearch._tokenize(p)
+        sizes.append(len(p_w))
+        for w in p_w:
+            index.setdefault(w, []).append(tid)
+    tokens = sorted(index)  # Code point order == UTF-8 byte order
+    grams = TrigramIndex.build(tokens).grams
+    gram_keys = sorted(grams)
+
+    sections = {
+        "topic_str": _strings(blob, names),
+        "topic_sol": array("I", [0]),
+        "topic_sizes": sizes,
+        "name_order": array("I", sorted(range(len(names)), key=names.__getitem__)),
+        "sol_str": _strings(blob, (s for p in names for s in kb[p])),
+        "token_str": _strings(blob, tokens),
+        "token_post": array("Q", [0]),
+        "postings": array("I"),
+        "gram_str": _strings(blob, gram_keys),
+        "gram_post": array("Q", [0]),
+        "gram_words": array("I"),
+    }
+    for p in names:
+        sections["topic_sol"].append(sections["topic_sol"][-1] + len(kb[p]))
+    for w in tokens:
+        sections["postings"].extend(index[w])
+        sections["token_post"].append(len(sections["postings"]))
+    for g in gram_keys:
+        sections["gram_words"].extend(grams[g])
+        sections["gram_post"].append(len(sections["gram_words"]))
+
+    fields = (
+        _QKB_MAGIC, len(names), len(sections["sol_str"]) - 1, len(tokens),
+        len(sections["postings"]), sum(1 for size in sizes if size), len(gram_keys), len(sections["gram_words"]),
+        source_version,
+    )
+    out_path = Path(out) if out else compiled_kb_path(file)
+    _write_mapped(out_path, _QKB_HEADER, fields, _QKB_SECTIONS, sections, blob)
+    log.info(f"Compiled KB: {len(names)} topics, {len(tokens)} tokens, {len(gram_keys)} trigrams -> {out_path}")
+    return out_path
+
+def _bisect(n: int, key: Callable[[int], str], target: str) -> int:
+    """First i in range(n) with key(i) >= target (bisect_left without Python 3.10's key=)"""
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key(mid) < target:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+class CompiledKB(_MappedFile, Mapping):
+    """
+    Read-only KB backed by an mmap of a compiled file. Topics and solutions
+    are decoded only when accessed, and the pages are shared between every
+    process that maps the same file.
+    """
+    MAGIC, HEADER, SECTIONS = _QKB_MAGIC, _QKB_HEADER, _QKB_SECTIONS
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.n_topics, self.n_scorable, self.source_version = self.header[1], self.header[5], self.header[8]
+        self.topics = _Strings(self, self._topic_str)
+        self.topic_sizes = self._topic_sizes
+        self.index = TokenIndex(self, self._token_str, self._token_post, self._postings)
+        self.trigrams = TrigramIndex(_Strings(self, self._token_str),
+                                     TokenIndex(self, self._gram_str, self._gram_post, self._gram_words))
+
+    def _counts(self) -> Dict[str, int]:
+        n_topics, n_solutions, n_tokens, n_postings, _, n_grams, n_gram_words = self.header[1:8]
+        return {
+            "topic_str": n_topics + 1, "topic_sol": n_topics + 1,
+            "topic_sizes": n_topics, "name_order": n_topics,
+            "sol_str": n_solutions + 1, "token_str": n_tokens + 1,
+            "token_post": n_tokens + 1, "postings": n_postings,
+            "gram_str": n_grams + 1, "gram_post": n_grams + 1, "gram_words": n_gram_words,
+        }
+
+    def topic(self, tid: int) -> str:
+        return self._str(self._topic_str, tid)
+
+    def solutions(self, tid: int) -> List[str]:
+        return [self._str(self._sol_str, i) for i in range(self._topic_sol[tid], self._topic_sol[tid + 1])]
+
+    def topic_id(self, name: str) -> int:
+        order = self._name_order
+        i = _bisect(self.n_topics, lambda k: self.topic(order[k]), name)
+        if i < self.n_topics and self.topic(order[i]) == name:
+            return order[i]
+        raise KeyError(name)
+
+    def __getitem__(self, name: str) -> List[str]:
+        return self.solutions(self.topic_id(name))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.topics)
+
+    def __len__(self) -> int:
+        return self.n_topics
+
+class _Strings(Sequence):
+    """One string section of a mapped file (topic names, tokens, BM25 terms), decoded on access"""
+    def __init__(self, kb: _MappedFile, offsets):
+        self.kb = kb
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.kb._str(self.offsets, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.kb._str(self.offsets, i)
+
+class _StringIds(Mapping):
+    """Sorted string section -> position of each string, by binary search"""
+    def __init__(self, strings: _Strings):
+        self.strings = strings
+
+    def __getitem__(self, w: str) -> int:
+        n = len(self.strings)
+        i = _bisect(n, self.strings.__getitem__, w)
+        if i < n and self.strings[i] == w:
+            return i
+        raise KeyError(w)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.strings)
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+class TokenIndex(Mapping):
+    """Prebuilt string -> posting list index of a compiled KB (topic ids per token, token ids per trigram)"""
+    def __init__(self, kb: CompiledKB, keys, offsets, postings):
+        self.kb = kb
+        self.keys = keys
+        self.offsets = offsets
+        self.postings = postings
+        self.n_tokens = len(self.offsets) - 1
+
+    def token(self, i: int) -> str:
+        return self.kb._str(self.keys, i)
+
+    def __getitem__(self, w: str) -> Sequence[int]:
+        i = _bisect(self.n_tokens, self.token, w)
+        if i < self.n_tokens and self.token(i) == w:
+            return self.postings[self.offsets[i]:self.offsets[i + 1]]
+        raise KeyError(w)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.token(i) for i in range(self.n_tokens))
+
+    def __len__(self) -> int:
+        return self.n_tokens
+
+class KBGeneration:
+    """
+    Generation counter of the published KB: an 8-byte file that every worker
+    maps read-only. The loader bumps it in place after publishing, so checking
+    for a new KB is a read of shared memory rather than a stat of the KB files.
+    """
+    FORMAT = struct.Struct("=Q")
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._mm: Optional[mmap.mmap] = None
+
+    def value(self) -> int:
+        """Current generation (0 until the KB is first published)"""
+        if self._mm is None:
+            try:
+                with open(self.path, "rb") as f:
+                    self._mm = mmap.mmap(f.fileno(), self.FORMAT.size, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return 0
+        return self.FORMAT.unpack_from(self._mm, 0)[0]
+
+    def bump(self) -> int:
+        """Increment the counter, written in place so existing mappings see it"""
+        if not self.path.exists():
+            _atomic_write(self.path, lambda f: f.write(self.FORMAT.pack(0)))
+        with open(self.path, "r+b") as f:
+            value = self.FORMAT.unpack(f.read(self.FORMAT.size))[0] + 1
+            f.seek(0)
+            f.write(self.FORMAT.pack(value))
+        return value
+
+@cache_resource(show_spinner=False)
+def kb_generation(file: str = CONFIG["KB_FILE"]) -> KBGeneration:
+    return KBGeneration(compiled_kb_path(file).with_suffix(".gen"))
+
+def kb_stamp(file: str = CONFIG["KB_FILE"]) -> Optional[int]:
+    """What KB-derived state (engines, response caches) is keyed on: the published generation when KB_SHARED, else `kb_version`"""
+    if CONFIG["KB_SHARED"]:
+        return kb_generation(file).value()
+    return kb_version(file)
+
+def publish_kb(file: str = CONFIG["KB_FILE"]) -> int:
+    """
+    Compile the KB for shared workers and build the sidecar indexes the
+    configured search needs, then bump the generation so workers re-attach
+    """
+    searcher = QuantumSearch(CompiledKB(compile_kb(file)), file)
+    stages = {CONFIG["SEARCH_BACKEND"], CONFIG["SEARCH_RERANKER"]}
+    if "bm25" in stages:
+        searcher.bm25
+    if "semantic" in stages:
+        searcher.semantic
+    generation = kb_generation(file).bump()
+    log.info(f"Published KB generation {generation}: {len(searcher.problems)} topics")
+    return generation
+
+def run_kb_loader(file: str = CONFIG["KB_FILE"]):
+    """
+    The KB_SHARED loader process: publishes the KB at start and again whenever
+    its files change (`save_kb`, upserts, compaction). Workers then map the
+    compiled KB (with its trigram index) and the BM25 and semantic sidecars
+    instead of parsing the JSON or building indexes; they only read the
+    semantic sidecar's few-byte JSON stamp.
+    """
+    published = None
+    while True:
+        version = kb_version(file, include_compiled=False)
+        if version != published:
+            try:
+                publish_kb(file)
+                published = version
+            except Exception as e:
+                KB_ERRORS.inc(op="publish")
+                log.error(f"KB publish failed: {e}")
+        time.sleep(CONFIG["KB_SHARED_POLL"])
+
+# ===== Chat History =====
+class ChatHistoryStore:
+    """
+    Append-only JSON Lines log of one conversation. Every message is written as
+    one line when it is sent; recent messages are read backwards from the end of
+    the file, so loading the last N costs the same however long the log grows.
+    """
+    CHUNK = 64 * 1024
+
+    def __init__(self, file):
+        self.path = Path(file)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _encode(m: Message) -> bytes:
+        record = {
+            "role": m.role.value,
+            "content": m.content,
+            "timestamp": m.timestamp,
+            "priority": m.priority.value if m.priority else None,
+            "id": m.id,
+        }
+        return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf8")
+
+    @staticmethod
+    def _decode(line: bytes) -> Message:
+        record = json.loads(line)
+        return Message(
+            Role(record["role"]), record["content"], record["timestamp"],
+            Priority(record["priority"]) if record.get("priority") else None,
+            record.get("id") or uuid.uuid4().hex[:12],
+        )
+
+    def append(self, m: Message):
+        data = self._encode(m)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.lock, open(self.path, "a+b") as f:
+                if f.seek(0, os.SEEK_END) > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        data = b"\n" + data  # End a torn last line, or this record would be glued onto it
+                f.write(data)
+        except OSError as e:
+            log.warning(f"History append failed: {e}")
+
+    def recent(self, n: int, end: Optional[int] = None) -> Tuple[List[Message], int]:
+        """
+        Up to n messages ending before byte offset `end` (default: end of file),
+        plus the offset of the first one returned - older messages exist if it is > 0.
+        Torn or corrupt lines are skipped without counting towards n; reading goes
+        on until n messages are found or the start of the file is reached.
+        """
+        if n <= 0 or not self.path.exists():
+            return [], 0
+        found: List[Tuple[int, Message]] = []  # (offset, message), newest first
+        try:
+            with open(self.path, "rb") as f:
+                pos = f.seek(0, os.SEEK_END) if end is None else end
+                head = b""  # Start of the oldest line seen so far, completed by the next chunk
+                while pos > 0 and len(found) < n:
+                    step = min(self.CHUNK, pos)
+                    pos -= step
+                    f.seek(pos)
+                    lines = (f.read(step) + head).split(b"\n")
+                    head = lines.pop(0) if pos > 0 else b""
+                    offset = pos + len(head) + 1 if pos > 0 else 0
+                    starts = []
+                    for line in lines:
+                        starts.append(offset)
+                        offset += len(line) + 1
+                    for start, line in zip(reversed(starts), reversed(lines)):
+                        if len(found) == n:
+                            break
+                        if not line.strip():
+                            continue
+                        try:
+                            found.append((start, self._decode(line)))
+                        except (ValueError, KeyError) as e:
+                            log.warning(f"Skipping corrupt history line: {e}")
+        except OSError as e:
+            log.warning(f"History load failed: {e}")
+            return [], 0
+        return [m for _, m in reversed(found)], found[-1][0] if len(found) == n else 0
+
+    def clear(self):
+        with self.lock:
+            self.path.unlink(missing_ok=True)
+
+# ===== Search Analytics =====
+class SearchAnalytics:
+    """
+    Bounded, thread-safe search log for the analytics view. Searches are kept in
+    a ring buffer of (epoch seconds, interned query id); per-minute buckets cover
+    the last 24h and a running Counter covers the trending window, so `stats()`
+    costs the same however many searches have been recorded.
+    """
+    BUCKET_SECONDS = 60
+    N_BUCKETS = 24 * 60
+
+    def __init__(self, capacity: int = CONFIG["ANALYTICS_CAPACITY"], window: int = CONFIG["TRENDING_WINDOW"]):
+        self.capacity = max(1, capacity)
+        self.window = min(max(1, window), self.capacity)
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.times = array("d", [0.0]) * self.capacity
+            self.qids = array("l", [0]) * self.capacity
+            self.head = 0  # Next slot to write
+            self.size = 0
+            self.total = 0
+            # Interned queries, refcounted by ring slots so ids are freed on overwrite
+            self.ids: Dict[str, int] = {}
+            self.queries: List[Optional[str]] = []
+            self.refs: List[int] = []
+            self.free: List[int] = []
+            self.bucket_minute = array("q", [-1]) * self.N_BUCKETS
+            self.bucket_count = array("q", [0]) * self.N_BUCKETS
+            self.trending: Counter = Counter()  # Query id -> count over the last `window` searches
+
+    def __len__(self) -> int:
+        """Searches recorded since the last clear (including ones rotated out)"""
+        return self.total
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        """Retained searches, oldest first, as {"query", "timestamp"} records"""
+        with self.lock:
+            start = (self.head - self.size) % self.capacity
+            slots = [(start + i) % self.capacity for i in range(self.size)]
+            entries = [(self.queries[self.qids[i]], self.times[i]) for i in slots]
+        for query, ts in entries:
+            yield {"query": query, "timestamp": datetime.fromtimestamp(ts).isoformat()}
+
+    def record(self, query: str, ts: Optional[float] = None):
+        ts = time.time() if ts is None else ts
+        with self.lock:
+            if self.size >= self.window:
+                old = self.qids[(self.head - self.window) % self.capacity]
+                self.trending[old] -= 1
+                if not self.trending[old]:
+                    del self.trending[old]
+            if self.size == self.capacity:
+                self._release(self.qids[self.head])
+            else:
+                self.size += 1
+            qid = self._intern(query)
+            self.times[self.head] = ts
+            self.qids[self.head] = qid
+            self.head = (self.head + 1) % self.capacity
+            self.total += 1
+            self.trending[qid] += 1
+
+            minute = int(ts // self.BUCKET_SECONDS)
+            slot = minute % self.N_BUCKETS
+            if self.bucket_minute[slot] != minute:  # Bucket last used a day (or more) ago
+                self.bucket_minute[slot] = minute
+                self.bucket_count[slot] = 0
+            self.bucket_count[slot] += 1
+
+    def stats(self, now: Optional[float] = None) -> Dict:
+        """Total searches, searches in the last 24h and the top 3 of the trending window"""
+        current = int((time.time() if now is None else now) // self.BUCKET_SECONDS)
+        with self.lock:
+            recent = sum(count for minute, count in zip(self.bucket_minute, self.bucket_count)
+                         if current - self.N_BUCKETS < minute <= current)
+            trending = [(self.queries[qid], count) for qid, count in self.trending.most_common(3)]
+            return {"total": self.total, "recent": recent, "trending": trending}
+
+    def _intern(self, query: str) -> int:
+        qid = self.ids.get(query)
+        if qid is None:
+            if self.free:
+                qid = self.free.pop()
+                self.queries[qid] = query
+            else:
+                qid = len(self.queries)
+                self.queries.append(query)
+                self.refs.append(0)
+            self.ids[query] = qid
+        self.refs[qid] += 1
+        return qid
+
+    def _release(self, qid: int):
+        self.refs[qid] -= 1
+        if not self.refs[qid]:
+            del self.ids[self.queries[qid]]
+            self.queries[qid] = None
+            self.free.append(qid)
+
+# ===== Quantum Randomness =====
+_MASK64 = (1 << 64) - 1
+
+def is_deterministic() -> bool:
+    return CONFIG["QUANTUM_MODE"] == "deterministic"
+
+def noise_key(text: str) -> int:
+    """Seeded 64-bit hash used to derive deterministic noise"""
+    data = f"{CONFIG['QUANTUM_SEED']}\x00{text}".encode("utf8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+def query_key(query: str) -> int:
+    """Noise key of a query's word set - scoring only ever sees the set"""
+    return noise_key(" ".join(sorted(set(query.lower().split()))))
+
+def mix_noise(query_h: int, topic_h: int) -> float:
+    """Uniform [0, 1) value from a (query, topic) key pair (splitmix64 finalizer)"""
+    z = query_h ^ topic_h
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    z ^= z >> 31
+    return (z >> 11) * 2.0 ** -53
+
+def mix_noise_array(query_h: "np.ndarray", topic_h: "np.ndarray") -> "np.ndarray":
+    """Vectorized `mix_noise` over broadcastable uint64 key arrays (uint64 arithmetic wraps like the masked ints)"""
+    z = query_h ^ topic_h
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+def quantum_noise(query: str, topic: str) -> float:
+    """Noise for one (query, topic) pair: random when live, a pure function when deterministic"""
+    if not is_deterministic():
+        return random.random()
+    return mix_noise(query_key(query), noise_key(topic))
+
+def quantum_choice(options: List[str], key: str) -> str:
+    if not is_deterministic():
+        return random.choice(options)
+    return options[noise_key(key) % len(options)]
+
+# ===== Tracing =====
+class LatencyHistogram:
+    """Log-bucketed latency histogram: O(1) observe, percentiles within one bucket (~19%)"""
+    BOUNDS = [1e-6 * 2 ** (i / 4) for i in range(112)]  # 1us .. ~4 min
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)  # Last bucket: above the largest bound
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        i = math.ceil(4 * math.log2(seconds * 1e6)) if seconds > 1e-6 else 0
+        self.counts[i if i < len(self.BOUNDS) else -1] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (capped at the max seen)"""
+        rank, seen = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= rank:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+class Tracer:
+    """
+    Span timings for the query pipeline, kept as in-memory histograms, plus
+    cProfile sampling on demand. While disabled, `traced` functions cost one
+    attribute check.
+    """
+    def __init__(self):
+        self.enabled = CONFIG["TRACING"]
+        self.profile_rate = CONFIG["TRACE_PROFILE_RATE"]  # Fraction of profiled calls to sample
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._profile_lock = threading.Lock()  # One active profiler at a time
+        self._profile_stats = None  # pstats.Stats aggregated over every sampled call
+
+    def observe(self, name: str, seconds: float):
+        with self.lock:
+            try:
+                self.histograms[name].observe(seconds)
+            except KeyError:
+                hist = self.histograms[name] = LatencyHistogram()
+                hist.observe(seconds)
+
+    @contextmanager
+    def span(self, name: str, profile: bool = False):
+        if not self.enabled:
+            yield
+            return
+        profiler = None
+        if profile and self.profile_rate > 0 and random.random() < self.profile_rate \
+                and self._profile_lock.acquire(blocking=False):
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+            if profiler is not None:
+                profiler.disable()
+                self._add_profile(profiler)
+                self._profile_lock.release()
+
+    def span_iter(self, name: str, items: Iterable, profile: bool = False) -> Iterator:
+        """
+        `span` for a stream: only the time spent producing each item is recorded
+        (and profiled), not the time the consumer holds the stream between items
+        """
+        if not self.enabled:
+            yield from items
+            return
+        profiler = None
+        if profile and self.profile_rate > 0 and random.random() < self.profile_rate:
+            import cProfile
+            profiler = cProfile.Profile()
+        items = iter(items)
+        busy = 0.0
+        try:
+            while True:
+                # The profiler lock is taken per item, so nothing is held across a yield
+                profiling = profiler is not None and self._profile_lock.acquire(blocking=False)
+                if profiling:
+                    profiler.enable()
+                start = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                finally:
+                    busy += time.perf_counter() - start
+                    if profiling:
+                        profiler.disable()
+                        self._profile_lock.release()
+                yield item
+        finally:
+            if hasattr(items, "close"):
+                items.close()
+            self.observe(name, busy)
+            if profiler is not None:
+                with self._profile_lock:
+                    self._add_profile(profiler)
+
+    def _add_profile(self, profiler):
+        import pstats
+        if self._profile_stats is None:
+            self._profile_stats = pstats.Stats(profiler)
+        else:
+            self._profile_stats.add(profiler)
+
+    def profile_report(self, limit: int = 25) -> str:
+        """Top functions by cumulative time over every sampled call"""
+        if self._profile_stats is None:
+            return "No profiles sampled yet."
+        out = StringIO()
+        with self._profile_lock:
+            self._profile_stats.stream = out
+            self._profile_stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {name: hist.summary() for name, hist in sorted(self.histograms.items())}
+
+    def export_json(self) -> str:
+        """Percentiles plus raw bucket counts (seconds) for offline analysis"""
+        with self.lock:
+            spans = {
+                name: {**hist.summary(), "buckets": [
+                    [LatencyHistogram.BOUNDS[i] if i < len(LatencyHistogram.BOUNDS) else None, c]
+                    for i, c in enumerate(hist.counts) if c
+                ]}
+                for name, hist in sorted(self.histograms.items())
+            }
+        return json.dumps({"exported_at": datetime.now().isoformat(), "spans": spans}, indent=2)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+        with self._profile_lock:
+            self._profile_stats = None
+
+@cache_resource(show_spinner=False)
+def get_tracer() -> Tracer:
+    """Process-wide tracer, kept across Streamlit reruns"""
+    return Tracer()
+
+TRACER = get_tracer()
+
+def traced(name: str, profile: bool = False):
+    """Record every call of the decorated function as a `name` span"""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return fn(*args, **kwargs)
+            if profile and TRACER.profile_rate > 0:
+                with TRACER.span(name, profile):
+                    return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                TRACER.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
 # ===== Core Logic =====
+class StageClock:
+    """Measures consecutive query pipeline stages and reports each one as it finishes"""
+    def __init__(self, on_stage: Optional[Callable[[str, float], None]] = None):
+        self.on_stage = on_stage
+        self.timings: Dict[str, float] = {}
+        self.last = time.perf_counter()
+
+    def __call__(self, stage: str):
+        now = time.perf_counter()
+        self.timings[stage] = now - self.last
+        self.last = now
+        if TRACER.enabled:
+            TRACER.observe(f"stage.{stage}", self.timings[stage])
+        if self.on_stage:
+            self.on_stage(stage, self.timings[stage])
+
 class QuantumSearch:
-    def __init__(self, kb: Dict[str, List[str]]):
+    def __init__(self, kb: Dict[str, List[str]], kb_file: Optional[str] = None,
+                 analytics: Optional[SearchAnalytics] = None):
         self.kb = kb
-        self.problems = list(kb.keys())
-        self.search_history = []
+        self.kb_file = kb_file  # Where derived indexes (e.g. BM25 stats) may be persisted
+        # Pass a shared store (see `get_search_analytics`) to keep the log across engine rebuilds
+        self.search_history = analytics if analytics is not None else SearchAnalytics()
+
+        # Inverted index (token -> posting list of topic ids) plus the size of
+        # every topic's word set, so Jaccard only runs for topics sharing a token
+        if isinstance(kb, CompiledKB):
+            # Prebuilt and read in place from the mapped file
+            self.problems = kb.topics
+            self.index = kb.index
+            self.topic_sizes = kb.topic_sizes
+            self.n_scorable = kb.n_scorable
+        else:
+            self.problems = list(kb.keys())
+            self.index: Dict[str, List[int]] = {}
+            self.topic_sizes: List[int] = []
+            for tid, p in enumerate(self.problems):
+                p_w = self._tokenize(p)
+                self.topic_sizes.append(len(p_w))
+                for w in p_w:
+                    self.index.setdefault(w, []).append(tid)
+            self.n_scorable = sum(1 for size in self.topic_sizes if size)
+        self._vector: Optional["VectorScorer"] = None
+        self._bm25: Optional["BM25Index"] = None
+        self._semantic: Optional["SemanticIndex"] = None
+        self._trigrams: Optional["TrigramIndex"] = None
+        self._hashes: Tuple[Optional[int], List[int]] = (None, [])
+        self._hash_array: Tuple[Optional[int], Optional["np.ndarray"]] = (None, None)
+        self._unscorable: Optional["np.ndarray"] = None  # Topics without words (never scored)
+        self._stages: Dict[Tuple[str, str], object] = {}
+
+    @property
+    def topic_hashes(self) -> List[int]:
+        """Per-topic noise keys for deterministic mode, rebuilt if the seed changes"""
+        seed, hashes = self._hashes
+        if seed != CONFIG["QUANTUM_SEED"]:
+            hashes = [noise_key(p) for p in self.problems]
+            self._hashes = (CONFIG["QUANTUM_SEED"], hashes)
+        return hashes
+
+    @property
+    def topic_hash_array(self) -> "np.ndarray":
+        """`topic_hashes` as a uint64 array, for vectorized deterministic noise"""
+        seed, hashes = self._hash_array
+        if seed != CONFIG["QUANTUM_SEED"]:
+            hashes = np.array(self.topic_hashes, dtype=np.uint64)
+            self._hash_array = (CONFIG["QUANTUM_SEED"], hashes)
+        return hashes
+
+    @property
+    def vector(self) -> "VectorScorer":
+        """NumPy scoring backend, built on first use"""
+        if self._vector is None:
+            self._vector = VectorScorer(self)
+        return self._vector
+
+    @property
+    def bm25(self) -> "BM25Index":
+        """BM25 backend, loaded from beside the KB or built on first use"""
+        if self._bm25 is None:
+            self._bm25 = BM25Index.load_or_build(self.kb, self.problems, self.kb_file)
+        return self._bm25
+
+    @property
+    def semantic(self) -> "SemanticIndex":
+        """Embedding backend, mapped from beside the KB or built on first use"""
+        if self._semantic is None:
+            self._semantic = SemanticIndex.load_or_build(self.kb, self.problems, self.kb_file)
+        return self._semantic
+
+    @property
+    def retriever(self) -> "Retriever":
+        """Candidate generation and scoring stages of the configured SEARCH_BACKEND"""
+        backend = CONFIG["SEARCH_BACKEND"]
+        stage = self._stages.get(("retriever", backend))
+        if stage is None:
+            stage = self._stages[("retriever", backend)] = RETRIEVERS.get(backend, IndexRetriever)(self)
+        return stage
+
+    @property
+    def reranker(self) -> Optional["Reranker"]:
+        """Re-rank stage named by SEARCH_RERANKER, if any"""
+        name = CONFIG["SEARCH_RERANKER"]
+        if name is None:
+            return None
+        stage = self._stages.get(("reranker", name))
+        if stage is None:
+            stage = self._stages[("reranker", name)] = RERANKERS[name](self)
+        return stage
+
+    @staticmethod
+    def _tokenize(text: str) -> set:
+        return set(text.lower().split())
+
+    @property
+    def trigrams(self) -> "TrigramIndex":
+        """Trigram index over the topic vocabulary: prebuilt in a compiled KB, else built on first use"""
+        if self._trigrams is None:
+            self._trigrams = self.kb.trigrams if isinstance(self.kb, CompiledKB) else TrigramIndex.build(self.index)
+        return self._trigrams
+
+    def query_tokens(self, query: str) -> set:
+        """Query word set, with unknown words corrected to their closest topic word"""
+        q_w = self._tokenize(query)
+        if not CONFIG["FUZZY_MATCHING"]:
+            return q_w
+        out = set()
+        for w in q_w:
+            if w not in self.index:
+                w = self.trigrams.nearest(w, CONFIG["FUZZY_MIN_SIMILARITY"]) or w
+            out.add(w)
+        return out
 
     def _similarity(self, q: str, p: str) -> float:
         try:
@@ -348,63 +1614,938 @@ class QuantumSearch:
             j = intersection / union if union > 0 else 0
             
             # Add quantum randomness factor for simulation
-            quantum_factor = CONFIG["QUANTUM_RANDOMNESS_FACTOR"] * random.random()
+            quantum_factor = CONFIG["QUANTUM_RANDOMNESS_FACTOR"] * quantum_noise(q, p)
             return min(1.0, j + quantum_factor)
         except Exception as e:
             log.error(e)
             return 0.0
 
-    def search(self, query: str, n: int = 5) -> List[str]:
+    def _scan(self, query: str) -> List[Tuple[str, float]]:
+        """Reference linear scan: scores every topic with `_similarity`"""
+        return [(p, self._similarity(query, p)) for p in self.problems]
+
+    def _retrieve(self, q_w: set) -> Dict[int, int]:
+        """Candidate topics with their intersection size (query tokens they were posted under)"""
+        hits: Dict[int, int] = {}
+        for w in q_w:
+            for tid in self.index.get(w, ()):
+                hits[tid] = hits.get(tid, 0) + 1
+        return hits
+
+    def _jaccard_buckets(self, q_w: set, hits: Dict[int, int]) -> Iterator[Tuple[float, Iterable[Tuple[int, float]]]]:
+        """
+        Candidates grouped by intersection size, largest first. A topic sharing
+        h of the query's words has Jaccard <= h / |q|, so that is each group's bound.
+        """
+        by_hits: Dict[int, List[int]] = {}
+        for tid, h in hits.items():
+            by_hits.setdefault(h, []).append(tid)
+        for h in sorted(by_hits, reverse=True):
+            yield h / len(q_w), ((tid, h / (len(q_w) + self.topic_sizes[tid] - h)) for tid in by_hits[h])
+
+    def _scored(self, query: str, buckets: Iterable[Tuple[float, Iterable[Tuple[int, float]]]],
+                candidates: Mapping[int, float], n: int) -> Iterator[Tuple[float, int, float]]:
+        """
+        Streams (upper bound, topic id, score) with non-increasing bounds:
+        candidate similarities plus quantum noise, then the noise-only topics.
+        Scores are only computed when the consumer gets that far.
+        """
+        factor = CONFIG["QUANTUM_RANDOMNESS_FACTOR"]
+        if is_deterministic():
+            q_h, hashes = query_key(query), self.topic_hashes
+            noise = lambda tid: mix_noise(q_h, hashes[tid])
+        else:
+            noise = lambda tid: random.random()
+        for bound, items in buckets:
+            bound = min(1.0, bound + factor)
+            for tid, sim in items:
+                yield bound, tid, min(1.0, sim + factor * noise(tid))
+        tail = self._seeded_tail(query, n, candidates) if is_deterministic() else self._noise_tail(n, candidates)
+        for tid, score in tail:
+            yield score, tid, score
+
+    @staticmethod
+    def _top_k(stream: Iterable[Tuple[float, int, float]], n: int) -> List[Tuple[int, float]]:
+        """
+        Best n (topic id, score) pairs above threshold, ties in KB order, kept in
+        a size-n heap. Stops as soon as the stream's bound falls below the k-th best.
+        """
+        threshold = CONFIG["MIN_SIMILARITY_THRESHOLD"]
+        heap: List[Tuple[float, int]] = []  # (score, -tid); the root is the current k-th best
+        if n <= 0:
+            return []
+        for bound, tid, score in stream:
+            if bound < threshold or (len(heap) == n and bound < heap[0][0]):
+                break
+            if score < threshold:
+                continue
+            item = (score, -tid)
+            if len(heap) < n:
+                heappush(heap, item)
+            elif item > heap[0]:
+                heapreplace(heap, item)
+        return [(-neg_tid, score) for score, neg_tid in sorted(heap, reverse=True)]
+
+    def _noise_tail(self, n: int, candidates: Mapping[int, float], rng=random) -> List[Tuple[int, float]]:
+        """
+        Scores for topics that share no token with the query.
+
+        Their score is pure quantum noise, so instead of drawing it for every
+        topic we draw the top-n order statistics of the noise directly and
+        assign them to distinct random topics - the same distribution the
+        linear scan produces, at O(n) cost.
+        """
+        factor = CONFIG["QUANTUM_RANDOMNESS_FACTOR"]
+        threshold = CONFIG["MIN_SIMILARITY_THRESHOLD"]
+        pool = self.n_scorable - sum(1 for tid in candidates if self.topic_sizes[tid])
+        if factor <= threshold or pool <= 0 or n <= 0:
+            return []
+
+        def eligible(tid: int) -> bool:
+            return tid not in candidates and self.topic_sizes[tid] > 0
+
+        rest = None
+        if pool * 2 < len(self.problems):  # Sparse pool: rejection sampling would spin
+            rest = [tid for tid in range(len(self.problems)) if eligible(tid)]
+            rng.shuffle(rest)
+
+        out, taken, u = [], set(), 1.0
+        for k in range(pool, max(pool - n, 0), -1):
+            u *= rng.random() ** (1.0 / k)  # Next largest of k remaining uniforms
+            score = factor * u
+            if score < threshold:
+                break
+            if rest is not None:
+                tid = rest[len(out)]
+            else:
+                tid = rng.randrange(len(self.problems))
+                while tid in taken or not eligible(tid):
+                    tid = rng.randrange(len(self.problems))
+                taken.add(tid)
+            out.append((tid, min(1.0, score)))
+        return out
+
+    def _seeded_tail(self, query: str, n: int, candidates: Mapping[int, float]) -> List[Tuple[int, float]]:
+        """
+        Deterministic-mode scores for topics that share no token with the query,
+        best first. Each is `mix_noise` of the (query, topic) keys, exactly as in
+        the NumPy backend and the linear scan, so all of them rank these topics
+        alike. Unlike `_noise_tail` this hashes every topic (vectorized): O(topics)
+        per query is the price of reproducible rankings.
+        """
+        factor = CONFIG["QUANTUM_RANDOMNESS_FACTOR"]
+        threshold = CONFIG["MIN_SIMILARITY_THRESHOLD"]
+        if factor <= threshold or n <= 0 or not self.problems:
+            return []
+        if self._unscorable is None:
+            self._unscorable = np.flatnonzero(np.asarray(self.topic_sizes) == 0)
+        scores = factor * mix_noise_array(np.uint64(query_key(query)), self.topic_hash_array)
+        scores[self._unscorable] = -1.0
+        if candidates:
+            scores[np.fromiter(candidates, dtype=np.int64, count=len(candidates))] = -1.0
+        idx = np.flatnonzero(scores >= threshold)
+        if len(idx) > n:
+            kth = np.partition(scores[idx], len(idx) - n)[len(idx) - n]
+            idx = idx[scores[idx] >= kth]
+        order = np.lexsort((idx, -scores[idx]))[:n]
+        return [(int(idx[i]), min(1.0, float(scores[idx[i]]))) for i in order]
+
+    @staticmethod
+    def check(query: str):
+        """Raise the simulated failures some test queries trigger"""
         if query.strip().lower() == "simulate error":
             raise RuntimeError("💥 Simulated quantum decoherence event")
             
         if query.strip().lower() == "quantum flux":
             raise RuntimeError("🪐 Quantum flux capacitor malfunction")
-            
-        # Record search for analytics
-        self.search_history.append({
-            "query": query, 
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        scored = [(p, self._similarity(query, p)) for p in self.problems]
-        scored = [x for x in scored if x[1] >= CONFIG["MIN_SIMILARITY_THRESHOLD"]]
-        scored.sort(key=lambda x: x[1], reverse=True)
-        
-        out = []
-        for p, score in scored[:n]:
-            if score > 0.5:  # High confidence matches
-                out.extend(self.kb[p])
-            elif score > 0.3:  # Medium confidence - add prefix
-                out.extend([f"Possible match: {s}" for s in self.kb[p]])
-            else:  # Low confidence
-                out.extend([f"Related idea: {s}" for s in self.kb[p][:1]])
-                
-        return out[:CONFIG["MAX_SOLUTIONS"]]
+
+    @traced("search")
+    @timed(SEARCH_SECONDS)
+    def search(self, query: str, n: int = 5, clock: Optional["StageClock"] = None) -> List[str]:
+        """
+        Staged pipeline: candidate generation -> scoring -> optional re-rank ->
+        result assembly, each stage reported to `clock` as it finishes
+        """
+        return list(self._search_iter(query, n, clock))
+
+    def search_stream(self, query: str, n: int = 5, clock: Optional["StageClock"] = None) -> Iterator[str]:
+        """
+        `search` as a stream of solutions, for replies that render while they are
+        built. Ranking still has to finish first (the top-k heap only knows the best
+        topic once every candidate is scored), but topics are expanded one at a time,
+        so the top topic's solutions arrive before the rest are assembled. The span
+        and SEARCH_SECONDS cover only the time spent producing solutions.
+        """
+        return TRACER.span_iter("search", timed_iter(self._search_iter(query, n, clock), SEARCH_SECONDS.observe))
+
+    def _search_iter(self, query: str, n: int, clock: Optional["StageClock"]) -> Iterator[str]:
+        self.check(query)
+        self.record(query)
+
+        clock = clock or StageClock()
+        SEARCHES.inc(backend=CONFIG["SEARCH_BACKEND"])
+        retriever, reranker = self.retriever, self.reranker
+        terms, candidates = retriever.generate(query)
+        clock("candidates")
+        top = retriever.rank(query, terms, candidates, CONFIG["RERANK_CANDIDATES"] if reranker else n)
+        clock("score")
+        if reranker:
+            top = reranker.rerank(query, top, n)
+            clock("rerank")
+        yield from self._expand(top)
+        clock("assemble")
+
+    def search_many(self, queries: Iterable[str], n: int = 5, workers: Optional[int] = None) -> Iterator[List[str]]:
+        """
+        Results for many queries, yielded in input order. Unlike `search`, queries
+        are not added to the search history. Batches of BATCH_POOL_THRESHOLD
+        queries or more are split across a pool of `workers` processes.
+        """
+        queries = list(queries)
+        SEARCHES.inc(len(queries), backend=CONFIG["SEARCH_BACKEND"])
+        workers = workers or CONFIG["BATCH_WORKERS"] or os.cpu_count() or 1
+        size = CONFIG["BATCH_CHUNK_SIZE"]
+        chunks = [queries[i:i + size] for i in range(0, len(queries), size)]
+        if workers > 1 and len(chunks) > 1 and len(queries) >= CONFIG["BATCH_POOL_THRESHOLD"]:
+            kb = self.kb.path if isinstance(self.kb, CompiledKB) else self.kb
+            with futures.ProcessPoolExecutor(workers, initializer=_init_batch_worker,
+                                     initargs=(kb, self.kb_file, dict(CONFIG))) as pool:
+                for results, seconds in pool.map(_search_batch_chunk, chunks, [n] * len(chunks)):
+                    for t in seconds:
+                        SEARCH_SECONDS.observe(t)
+                    yield from results
+        else:
+            for chunk in chunks:
+                yield from self._search_chunk(chunk, n)
+
+    def _search_chunk(self, queries: List[str], n: int,
+                      observe: Callable[[float], None] = SEARCH_SECONDS.observe) -> Iterator[List[str]]:
+        """
+        `search` for a chunk of queries, with candidates generated for the whole
+        chunk at once (see `Retriever.generate_many`). Simulated failures raise
+        when their query's turn comes. Each query's search time (excluding the
+        time the consumer holds the generator) is passed to `observe`.
+        """
+        retriever, reranker = self.retriever, self.reranker
+        k = CONFIG["RERANK_CANDIDATES"] if reranker else n
+        start = time.perf_counter()
+        for query, terms, candidates in retriever.generate_many(queries):
+            self.check(query)
+            top = retriever.rank(query, terms, candidates, k)
+            if reranker:
+                top = reranker.rerank(query, top, n)
+            out = list(self._expand(top))
+            observe(time.perf_counter() - start)
+            yield out
+            start = time.perf_counter()
+
+    def record(self, query: str):
+        """Record search for analytics"""
+        self.search_history.record(query)
+
+    def solutions(self, tid: int) -> List[str]:
+        """Solutions of a topic by id (a compiled KB reads them in place instead of looking the name up)"""
+        if isinstance(self.kb, CompiledKB):
+            return self.kb.solutions(tid)
+        return self.kb[self.problems[tid]]
+
+    def _expand(self, ranked: List[Tuple[int, float]]) -> Iterator[str]:
+        """Turn ranked (topic id, score) pairs into confidence-labelled solutions, one topic at a time"""
+        return islice(chain.from_iterable(self._labelled(tid, score) for tid, score in ranked), CONFIG["MAX_SOLUTIONS"])
+
+    def _labelled(self, tid: int, score: float) -> List[str]:
+        sols = self.solutions(tid)
+        if score > 0.5:  # High confidence matches
+            return sols
+        elif score > 0.3:  # Medium confidence - add prefix
+            return [f"Possible match: {s}" for s in sols]
+        else:  # Low confidence
+            return [f"Related idea: {s}" for s in sols[:1]]
 
     def get_search_stats(self):
         """Return search statistics for analytics"""
-        if not self.search_history:
-            return {"total": 0, "recent": 0, "trending": []}
-        
-        # Calculate basic stats
-        total = len(self.search_history)
-        recent = len([s for s in self.search_history 
-                     if datetime.fromisoformat(s["timestamp"]) > datetime.now() - timedelta(hours=24)])
-        
-        # Find trending queries (simplified)
-        queries = [s["query"] for s in self.search_history[-20:]]  # Last 20 queries
-        trending = []
-        if queries:
-            from collections import Counter
-            trending = Counter(queries).most_common(3)
-            
+        return self.search_history.stats()
+
+# Per-process searcher for `QuantumSearch.search_many` worker pools
+_batch_searcher: Optional[QuantumSearch] = None
+
+def _init_batch_worker(kb, kb_file: Optional[str], config: Dict):
+    global _batch_searcher
+    CONFIG.update(config)
+    # Forked workers inherit the parent's RNG state; reseed so their noise is independent
+    random.seed()
+    if "numpy" in sys.modules:
+        np.random.seed()
+    if isinstance(kb, Path):
+        kb = CompiledKB(kb)
+    _batch_searcher = QuantumSearch(kb, kb_file)
+
+def _search_batch_chunk(queries: List[str], n: int) -> Tuple[List[List[str]], List[float]]:
+    """Results and per-query search seconds; the parent records them, as worker metrics are never scraped"""
+    seconds = []
+    return list(_batch_searcher._search_chunk(queries, n, seconds.append)), seconds
+
+class VectorScorer:
+    """
+    Vectorized Jaccard scoring over a sparse token-incidence matrix.
+
+    Postings are stored column-wise (token -> topic ids) in one contiguous
+    int32 array, so a query's intersection counts for every topic are a single
+    `np.bincount` over the postings of its tokens.
+    """
+    def __init__(self, searcher: QuantumSearch):
+        self.n_topics = len(searcher.problems)
+        self.vocab = {w: i for i, w in enumerate(searcher.index)}
+        if isinstance(searcher.index, TokenIndex):
+            # Compiled KB: postings are already contiguous in the mapped file
+            self.offsets = np.frombuffer(searcher.index.offsets, dtype=np.uint64).astype(np.int64)
+            self.postings = np.frombuffer(searcher.index.postings, dtype=np.uint32)
+        else:
+            lengths = [len(searcher.index[w]) for w in self.vocab]
+            self.offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=self.offsets[1:])
+            self.postings = np.fromiter(
+                (tid for w in self.vocab for tid in searcher.index[w]),
+                dtype=np.int32, count=int(self.offsets[-1])
+            )
+        self.sizes = np.asarray(searcher.topic_sizes, dtype=np.int32)
+        self.searcher = searcher
+
+    def _noise(self, queries: List[str], shape: Tuple[int, int]) -> "np.ndarray":
+        if not is_deterministic():
+            return np.random.random(shape)
+        q_h = np.array([query_key(q) for q in queries], dtype=np.uint64)[:, None]
+        return mix_noise_array(q_h, self.searcher.topic_hash_array[None, :])
+
+    def _postings(self, q_w: set) -> "np.ndarray":
+        ids = [self.vocab[w] for w in q_w if w in self.vocab]
+        if not ids:
+            return np.empty(0, dtype=np.int32)
+        return np.concatenate([self.postings[self.offsets[i]:self.offsets[i + 1]] for i in ids])
+
+    def score(self, query: str) -> "np.ndarray":
+        """Scores of one query against every topic, shape (n_topics,)"""
+        return self.score_batch([query])[0]
+
+    def score_batch(self, queries: List[str]) -> "np.ndarray":
+        """Scores of a batch of queries against every topic, shape (len(queries), n_topics)"""
+        n = self.n_topics
+        token_sets = [self.searcher.query_tokens(q) for q in queries]
+        rows = [self._postings(q_w) for q_w in token_sets]
+        flat = np.concatenate([r.astype(np.int64) + i * n for i, r in enumerate(rows)] or [np.empty(0, np.int64)])
+        inter = np.bincount(flat, minlength=len(queries) * n).reshape(len(queries), n)
+
+        q_sizes = np.array([len(q_w) for q_w in token_sets], dtype=np.int32)[:, None]
+        union = q_sizes + self.sizes[None, :] - inter
+        with np.errstate(divide="ignore", invalid="ignore"):
+            j = np.where(union > 0, inter / union, 0.0)
+        noise = CONFIG["QUANTUM_RANDOMNESS_FACTOR"] * self._noise(queries, j.shape)
+        scores = np.minimum(1.0, j + noise)
+        # `_similarity` gives 0 (no noise) when either side has no words
+        scores[(q_sizes == 0)[:, 0]] = 0.0
+        scores[:, self.sizes == 0] = 0.0
+        return scores
+
+    def top(self, scores: "np.ndarray", n: int) -> List[Tuple[int, float]]:
+        """Best n (topic id, score) pairs above threshold, ties in KB order"""
+        idx = np.flatnonzero(scores >= CONFIG["MIN_SIMILARITY_THRESHOLD"])
+        if len(idx) > n > 0:
+            kth = np.partition(scores[idx], len(idx) - n)[len(idx) - n]
+            idx = idx[scores[idx] >= kth]
+        order = np.lexsort((idx, -scores[idx]))[:max(n, 0)]
+        return [(int(idx[i]), float(scores[idx[i]])) for i in order]
+
+class TrigramIndex:
+    """
+    Character-trigram index over a vocabulary. Finding the closest word only
+    touches words that share a trigram with it, instead of computing an edit
+    distance against every word. Compiled KBs carry one prebuilt (see
+    `compile_kb`), and corrections are memoized per word.
+    """
+    def __init__(self, words: Sequence[str], grams: Mapping[str, Sequence[int]]):
+        self.words = words  # Vocabulary by word id
+        self.grams = grams  # trigram -> ids of the words containing it
+        self._nearest = lru_cache(maxsize=CONFIG["FUZZY_CACHE_SIZE"])(self._scan)
+
+    @classmethod
+    def build(cls, vocab: Iterable[str]) -> "TrigramIndex":
+        words = list(vocab)
+        grams: Dict[str, List[int]] = {}
+        for i, w in enumerate(words):
+            for g in cls.split(w):
+                grams.setdefault(g, []).append(i)
+        return cls(words, grams)
+
+    @staticmethod
+    def split(word: str) -> set:
+        padded = f"${word}$"
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def nearest(self, word: str, min_similarity: float) -> Optional[str]:
+        """Vocabulary word with the highest trigram Dice similarity, if it reaches min_similarity"""
+        return self._nearest(word, min_similarity, CONFIG["FUZZY_MAX_CANDIDATES"])
+
+    def _scan(self, word: str, min_similarity: float, max_candidates: Optional[int]) -> Optional[str]:
+        grams = self.split(word)
+        if not grams or min_similarity <= 0:
+            return None
+        # Dice >= m needs at least t shared trigrams, so every match contains one of the
+        # a - t + 1 rarest query trigrams (prefix filter): common trigrams are never scanned
+        a, m = len(grams), min(min_similarity, 1.0)
+        t = max(1, math.ceil(a * m / (2 - m) - 1e-9))
+        rare = sorted(grams, key=lambda g: len(self.grams.get(g, ())))[:a - t + 1]
+        # Rarest postings first, stopping at max_candidates words, so a correction costs
+        # a bounded number of comparisons however large the vocabulary grows
+        candidates = set()
+        for g in rare:
+            posting = self.grams.get(g, ())
+            if max_candidates is not None and len(candidates) + len(posting) > max_candidates:
+                candidates.update(islice(posting, max(0, max_candidates - len(candidates))))
+                break
+            candidates.update(posting)
+
+        # Highest similarity wins; ties go to the word closest in length, then vocabulary order
+        best = None
+        for i in candidates:
+            w = self.words[i]
+            w_grams = self.split(w)
+            sim = 2 * len(grams & w_grams) / (a + len(w_grams))
+            key = (sim, -abs(len(w) - len(word)), -i)
+            if sim >= min_similarity and (best is None or key > best):
+                best = key
+        return self.words[-best[2]] if best is not None else None
+
+class _BM25File(_MappedFile):
+    """BM25 sidecar: magic, n_docs, n_terms, n_postings, the KB version and params it was built for"""
+    MAGIC = b"QBM1"
+    SECTIONS = (
+        ("term_str", "Q"),   # n_terms + 1 blob offsets of terms (sorted)
+        ("term_post", "Q"),  # n_terms + 1 indexes into tids and tfs
+        ("idf", "d"),        # n_terms
+        ("tids", "I"),       # topic ids per term
+        ("tfs", "d"),        # term frequency of every posting
+        ("norms", "d"),      # n_docs
+    )
+    HEADER = struct.Struct("=4sIIIQ3d" + "Q" * (len(SECTIONS) + 1))
+
+    def _counts(self) -> Dict[str, int]:
+        n_docs, n_terms, n_postings = self.header[1:4]
         return {
-            "total": total,
-            "recent": recent,
-            "trending": trending
+            "term_str": n_terms + 1, "term_post": n_terms + 1, "idf": n_terms,
+            "tids": n_postings, "tfs": n_postings, "norms": n_docs,
         }
 
+class BM25Index:
+    """
+    Okapi BM25 over topic titles plus solution text. Scores are normalized by
+    the best score the query could reach, so they stay in [0, 1] and the
+    existing confidence bands (0.5 / 0.3) keep their meaning. Postings are flat
+    arrays, stored beside the KB as a mapped file that processes share.
+    """
+    WORD = re.compile(r"\w+")
+
+    def __init__(self, term_ids: Mapping[str, int], offsets: Sequence[int], tids: Sequence[int],
+                 tfs: Sequence[float], idf: Sequence[float], norms: Sequence[float], n_docs: int):
+        self.term_ids = term_ids  # term -> term id (in sorted term order)
+        self.offsets = offsets    # term id -> its postings, tids/tfs[offsets[i]:offsets[i + 1]]
+        self.tids = tids
+        self.tfs = tfs
+        self.idf = idf            # per term id
+        self.norms = norms        # per topic: k1 * (1 - b + b * dl / avgdl)
+        self.n_docs = n_docs
+
+    @classmethod
+    def terms(cls, text: str) -> set:
+        return set(cls.WORD.findall(text.lower()))
+
+    @staticmethod
+    def _params() -> List[float]:
+        return [CONFIG["BM25_K1"], CONFIG["BM25_B"], CONFIG["BM25_TITLE_WEIGHT"]]
+
+    @classmethod
+    def build(cls, kb: Mapping[str, List[str]], problems: Sequence[str]) -> "BM25Index":
+        k1, b, title_weight = cls._params()
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        lengths = []
+        for tid, p in enumerate(problems):
+            tf: Dict[str, int] = {}
+            for w in cls.WORD.findall(p.lower()):
+                tf[w] = tf.get(w, 0) + title_weight
+            for s in kb[p]:
+                for w in cls.WORD.findall(s.lower()):
+                    tf[w] = tf.get(w, 0) + 1
+            lengths.append(sum(tf.values()))
+            for w, f in tf.items():
+                tids, freqs = postings.setdefault(w, ([], []))
+                tids.append(tid)
+                freqs.append(f)
+
+        n = len(lengths)
+        avgdl = (sum(lengths) / n) if n else 1.0
+        terms = sorted(postings)
+        offsets, tids, tfs = array("Q", [0]), array("I"), array("d")
+        for w in terms:
+            tids.extend(postings[w][0])
+            tfs.extend(postings[w][1])
+            offsets.append(len(tids))
+        df = [len(postings[w][0]) for w in terms]
+        idf = array("d", (math.log(1 + (n - d + 0.5) / (d + 0.5)) for d in df))
+        norms = array("d", (k1 * (1 - b + b * dl / (avgdl or 1.0)) for dl in lengths))
+        return cls({w: i for i, w in enumerate(terms)}, offsets, tids, tfs, idf, norms, n)
+
+    @staticmethod
+    def path_for(kb_file: str) -> Path:
+        return Path(kb_file).with_suffix(".bm25")
+
+    def save(self, path, version: int):
+        blob = bytearray()
+        sections = {
+            "term_str": _strings(blob, self.term_ids), "term_post": array("Q", self.offsets),
+            "idf": array("d", self.idf), "tids": array("I", self.tids), "tfs": array("d", self.tfs),
+            "norms": array("d", self.norms),
+        }
+        fields = (_BM25File.MAGIC, self.n_docs, len(self.term_ids), len(self.tids), version, *self._params())
+        _write_mapped(path, _BM25File.HEADER, fields, _BM25File.SECTIONS, sections, blob)
+
+    @classmethod
+    def load(cls, path, version: int) -> Optional["BM25Index"]:
+        """Map stored statistics, if they were built for this KB version and the current params"""
+        f = _BM25File(path)
+        if f.header[4] != version or list(f.header[5:8]) != [float(p) for p in cls._params()]:
+            f.close()
+            return None
+        return cls(_StringIds(_Strings(f, f._term_str)), f._term_post, f._tids, f._tfs, f._idf, f._norms, f.header[1])
+
+    @classmethod
+    def load_or_build(cls, kb: Mapping[str, List[str]], problems: Sequence[str],
+                      kb_file: Optional[str] = None) -> "BM25Index":
+        """Map the stats stored beside the KB while they match its version, else rebuild and store"""
+        version = kb_version(kb_file, include_compiled=False) if kb_file else None
+        if version is None:
+            return cls.build(kb, problems)
+
+        path = cls.path_for(kb_file)
+        try:
+            if path.exists():
+                index = cls.load(path, version)
+                if index is not None:
+                    return index
+        except Exception as e:
+            log.warning(f"BM25 stats load failed: {e}")
+
+        index = cls.build(kb, problems)
+        try:
+            index.save(path, version)
+        except Exception as e:
+            log.warning(f"BM25 stats save failed: {e}")
+        return index
+
+    def score(self, terms: set) -> Dict[int, float]:
+        """Normalized BM25 score of every topic containing at least one query term"""
+        k1 = CONFIG["BM25_K1"]
+        unseen_idf = math.log(1 + (self.n_docs + 0.5) / 0.5)
+        ids = [self.term_ids.get(w) for w in terms]
+        best = sum(self.idf[i] if i is not None else unseen_idf for i in ids) * (k1 + 1)
+        scores: Dict[int, float] = {}
+        for i in ids:
+            if i is None:
+                continue
+            idf = self.idf[i]
+            lo, hi = self.offsets[i], self.offsets[i + 1]
+            for tid, f in zip(self.tids[lo:hi], self.tfs[lo:hi]):
+                scores[tid] = scores.get(tid, 0.0) + idf * f * (k1 + 1) / (f + self.norms[tid])
+        return {tid: min(1.0, sc / best) for tid, sc in scores.items()} if best else {}
+
+class SemanticIndex:
+    """
+    Local semantic retrieval with no model download. Words are mapped to shared
+    concepts ("laptop" -> computer, "sluggish" -> slow) from the SEMANTIC_LEXICON
+    data file and crudely stemmed, then
+    feature-hashed into a dense float32 vector: each feature adds a hashed sign to
+    a few dimensions (a sparse random projection). Topic vectors (title words plus
+    IDF-weighted solution words) form one contiguous matrix persisted beside the KB.
+    Large KBs are searched through an IVF index (k-means lists), so a query only
+    scores the topics in the few lists nearest to it.
+    """
+    WORD = re.compile(r"[a-z0-9]+")
+    N_HASHES = 3  # Dimensions each feature is added to
+    _lexicon: Optional[Tuple[str, Dict[str, str], frozenset, str]] = None  # (path, word -> concept, stop words, stamp)
+
+    def __init__(self, matrix: "np.ndarray", ivf: Optional[Tuple["np.ndarray", "np.ndarray", "np.ndarray"]] = None):
+        self.matrix = matrix  # (n_topics, dim) float32, L2-normalized rows
+        self.ivf = ivf  # (centroids, order, offsets), trained on first approximate search
+        self._slots: Dict[str, Tuple[Tuple[int, ...], Tuple[float, ...]]] = {}
+
+    @staticmethod
+    def _params() -> List:
+        return [CONFIG["SEMANTIC_DIM"], CONFIG["SEMANTIC_SEED"], CONFIG["SEMANTIC_TITLE_WEIGHT"]]
+
+    @classmethod
+    def lexicon(cls) -> Tuple[Dict[str, str], frozenset, str]:
+        """(word -> concept, stop words, content stamp) from SEMANTIC_LEXICON, read on first use"""
+        path = CONFIG["SEMANTIC_LEXICON"]
+        if cls._lexicon is None or cls._lexicon[0] != path:
+            try:
+                with open(path, "rb") as f:
+                    raw = f.read()
+                data = json.loads(raw)
+                concepts = {v: c for c, variants in data["concepts"].items() for v in variants}
+                stopwords = frozenset(data["stopwords"])
+            except (OSError, ValueError, KeyError, AttributeError) as e:
+                log.warning(f"Semantic lexicon load failed ({e}); matching words without concepts")
+                raw, concepts, stopwords = b"", {}, frozenset()
+            stamp = hashlib.blake2b(raw, digest_size=8).hexdigest()
+            cls._lexicon = (path, concepts, stopwords, stamp)
+        return cls._lexicon[1:]
+
+    @classmethod
+    def words(cls, text: str) -> List[str]:
+        """Concept-mapped, stemmed words of `text`, stop words dropped"""
+        concepts, stopwords, _ = cls.lexicon()
+        out = []
+        for w in cls.WORD.findall(text.lower()):
+            if w in stopwords:
+                continue
+            concept = concepts.get(w)
+            if concept is None:
+                for suffix in ("ing", "ed", "es", "s"):
+                    if w.endswith(suffix) and len(w) - len(suffix) >= 3:
+                        w = w[:-len(suffix)]
+                        break
+                concept = concepts.get(w, w)
+            out.append(concept)
+        return out
+
+    @staticmethod
+    def _hash_slots(feature: str, dim: int, seed: int) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf8"), digest_size=8,
+                                           key=seed.to_bytes(8, "little")).digest(), "little")
+        dims, signs = [], []
+        for k in range(SemanticIndex.N_HASHES):
+            bits = h >> (17 * k)
+            dims.append(bits & (dim - 1))
+            signs.append(1.0 if bits & (1 << 16) else -1.0)
+        return tuple(dims), tuple(signs)
+
+    @classmethod
+    def build(cls, kb: Mapping[str, List[str]], problems: Sequence[str]) -> "SemanticIndex":
+        dim, seed, title_weight = cls._params()
+        if dim & (dim - 1) or not 0 < dim <= 1 << 16:
+            raise ValueError("SEMANTIC_DIM must be a power of two up to 65536")
+        # Sparse topic x feature term frequencies (CSR)
+        feature_ids: Dict[str, int] = {}
+        ptr, fids, tfs = array("q", [0]), array("q"), array("f")
+        for p in problems:
+            tf = Counter()
+            for w in cls.words(p):
+                tf[w] += title_weight
+            for sol in kb[p]:
+                tf.update(cls.words(sol))
+            for w, f in tf.items():
+                fid = feature_ids.setdefault(w, len(feature_ids))
+                fids.append(fid)
+                tfs.append(f)
+            ptr.append(len(fids))
+
+        n = len(problems)
+        ptr, fids, tfs = (np.frombuffer(a, dtype=t) for a, t in ((ptr, np.int64), (fids, np.int64), (tfs, np.float32)))
+        idf = np.log1p(n / np.maximum(np.bincount(fids, minlength=len(feature_ids)), 1)).astype(np.float32)
+        weights = (1 + np.log(tfs)) * idf[fids]
+        slots = [cls._hash_slots(w, dim, seed) for w in feature_ids]
+        slot_dims = np.array([d for d, _ in slots], dtype=np.int64).reshape(-1, cls.N_HASHES)
+        slot_signs = np.array([sg for _, sg in slots], dtype=np.float32).reshape(-1, cls.N_HASHES)
+
+        # Project in row chunks so the bincount buffer stays small
+        matrix = np.zeros((n, dim), dtype=np.float32)
+        rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(ptr))
+        step = max(1, (1 << 20) // dim)
+        for a in range(0, n, step):
+            b = min(n, a + step)
+            sel = slice(ptr[a], ptr[b])
+            flat = (rows[sel] - a)[:, None] * dim + slot_dims[fids[sel]]
+            vals = slot_signs[fids[sel]] * weights[sel][:, None]
+            matrix[a:b] = np.bincount(flat.ravel(), vals.ravel(), minlength=(b - a) * dim).reshape(b - a, dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return cls(matrix)
+
+    @staticmethod
+    def path_for(kb_file: str) -> Path:
+        return Path(kb_file).with_suffix(".vec.npy")
+
+    @classmethod
+    def load_or_build(cls, kb: Mapping[str, List[str]], problems: Sequence[str],
+                      kb_file: Optional[str] = None) -> "SemanticIndex":
+        """Map the topic matrix stored beside the KB while it matches its version, else rebuild and store"""
+        version = kb_version(kb_file, include_compiled=False) if kb_file else None
+        if version is None:
+            return cls.build(kb, problems)
+
+        path = cls.path_for(kb_file)
+        meta = path.with_suffix(".json")
+        ivf_paths = [Path(kb_file).with_suffix(f".ivf-{part}.npy") for part in ("centroids", "order", "offsets")]
+        try:
+            if path.exists() and meta.exists():
+                with open(meta, "r", encoding="utf8") as f:
+                    data = json.load(f)
+                if (data["version"] == version and data["params"] == cls._params()
+                        and data.get("lexicon") == cls.lexicon()[2]):
+                    matrix = np.load(path, mmap_mode="r")
+                    if matrix.shape == (len(problems), CONFIG["SEMANTIC_DIM"]):
+                        ivf = None
+                        if data.get("ivf"):
+                            ivf = tuple(np.load(p, mmap_mode="r") for p in ivf_paths)
+                        return cls(matrix, ivf)
+        except Exception as e:
+            log.warning(f"Semantic index load failed: {e}")
+
+        index = cls.build(kb, problems)
+        if len(problems) > CONFIG["SEMANTIC_EXACT_MAX"]:
+            index.ivf = cls.train_ivf(index.matrix)
+        try:
+            _atomic_write(path, lambda f: np.save(f, index.matrix))
+            if index.ivf is not None:
+                for p, lists in zip(ivf_paths, index.ivf):
+                    _atomic_write(p, lambda f, lists=lists: np.save(f, lists))
+            _write_json_atomic({"version": version, "params": cls._params(), "lexicon": cls.lexicon()[2],
+                                "ivf": index.ivf is not None}, meta)
+        except Exception as e:
+            log.warning(f"Semantic index save failed: {e}")
+        return index
+
+    def embed(self, text: str) -> "np.ndarray":
+        """Unit query vector (all zeros if `text` has no content words)"""
+        dim, seed, _ = self._params()
+        vec = np.zeros(dim, dtype=np.float32)
+        for w in set(self.words(text)):
+            slot = self._slots.get(w)
+            if slot is None:
+                slot = self._slots[w] = self._hash_slots(w, dim, seed)
+            for d, sign in zip(*slot):
+                vec[d] += sign
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    @staticmethod
+    def _nearest(vectors: "np.ndarray", centroids: "np.ndarray") -> "np.ndarray":
+        out = np.empty(len(vectors), dtype=np.int64)
+        step = 1 << 13
+        for a in range(0, len(vectors), step):
+            out[a:a + step] = np.argmax(np.asarray(vectors[a:a + step]) @ centroids.T, axis=1)
+        return out
+
+    @classmethod
+    def train_ivf(cls, matrix: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+        """
+        IVF coarse quantizer: spherical k-means centroids (trained on a sample) and
+        topic ids grouped by nearest centroid, as (centroids, order, list offsets)
+        """
+        n = len(matrix)
+        n_lists = max(1, min(n, CONFIG["SEMANTIC_IVF_LISTS"] or int(2 * math.sqrt(n))))
+        rng = np.random.default_rng(CONFIG["SEMANTIC_SEED"])
+        sample = np.asarray(matrix[np.sort(rng.choice(n, min(n, 32 * n_lists), replace=False))])
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(6):
+            assign = cls._nearest(sample, centroids)
+            counts = np.bincount(assign, minlength=n_lists)
+            # Per-list sums as one bincount over (list, dimension) cells
+            dim = sample.shape[1]
+            flat = (assign[:, None] * dim + np.arange(dim)).ravel()
+            sums = np.bincount(flat, sample.ravel(), minlength=n_lists * dim).reshape(n_lists, dim).astype(np.float32)
+            sums[counts == 0] = centroids[counts == 0]  # Empty list: keep its centroid
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.divide(sums, norms, out=centroids, where=norms > 0)
+        assign = cls._nearest(matrix, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(n_lists + 1))
+        return centroids, order, offsets
+
+    def _lists(self) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+        if self.ivf is None:
+            self.ivf = self.train_ivf(self.matrix)
+        return self.ivf
+
+    def score(self, query: str) -> Dict[int, float]:
+        """Cosine similarity of the best SEMANTIC_CANDIDATES topics (positive scores only)"""
+        q = self.embed(query)
+        if not q.any():
+            return {}
+        if len(self.matrix) <= CONFIG["SEMANTIC_EXACT_MAX"]:
+            ids = None
+            sims = np.asarray(self.matrix @ q)
+        else:
+            # Only score the topics of the NPROBE lists whose centroids are closest
+            centroids, order, offsets = self._lists()
+            nprobe = min(CONFIG["SEMANTIC_NPROBE"], len(centroids))
+            lists = np.argpartition(-(centroids @ q), nprobe - 1)[:nprobe]
+            ids = np.sort(np.concatenate([order[offsets[c]:offsets[c + 1]] for c in lists]))
+            sims = np.asarray(self.matrix[ids] @ q)
+        k = CONFIG["SEMANTIC_CANDIDATES"]
+        top = np.argpartition(-sims, k)[:k] if len(sims) > k else np.arange(len(sims))
+        top = top[sims[top] > 0]
+        tids = top if ids is None else ids[top]
+        return {int(tid): float(min(1.0, sim)) for tid, sim in zip(tids, sims[top])}
+
+    def similarity(self, query: str, tids: Sequence[int]) -> "np.ndarray":
+        """Cosine similarity of the query to just the given topics"""
+        q = self.embed(query)
+        if not q.any() or not len(tids):
+            return np.zeros(len(tids), dtype=np.float32)
+        return np.asarray(self.matrix[np.asarray(tids, dtype=np.int64)] @ q)
+
+class Retriever:
+    """
+    First two search pipeline stages for one SEARCH_BACKEND: cheap candidate
+    generation (query -> terms and {topic id: base score}) and scoring, which
+    streams bounded buckets into `QuantumSearch._top_k`. Subclasses are looked
+    up by backend name in RETRIEVERS.
+    """
+    def __init__(self, searcher: QuantumSearch):
+        self.searcher = searcher
+
+    def candidates(self, query: str) -> Tuple[Collection[str], Dict[int, float]]:
+        raise NotImplementedError
+
+    def bound(self, terms: Collection[str], tid: int, base: float) -> float:
+        """Upper bound on the candidate's similarity, used to pick what CANDIDATE_BUDGET keeps"""
+        return base
+
+    def budget(self, terms: Collection[str], candidates: Dict[int, float]) -> Dict[int, float]:
+        """Keep the CANDIDATE_BUDGET candidates with the best bounds"""
+        limit = CONFIG["CANDIDATE_BUDGET"]
+        if limit is None or len(candidates) <= limit:
+            return candidates
+        return dict(nlargest(limit, candidates.items(), key=lambda item: self.bound(terms, *item)))
+
+    def generate(self, query: str) -> Tuple[Collection[str], Any]:
+        return self.candidates(query)
+
+    def generate_many(self, queries: List[str]) -> Iterator[Tuple[str, Collection[str], Any]]:
+        """(query, terms, candidates) for each query in order, generated once per distinct query"""
+        seen: Dict[str, Tuple[Collection[str], Any]] = {}
+        for query in queries:
+            if query not in seen:
+                seen[query] = self.generate(query)
+            yield (query,) + seen[query]
+
+    def buckets(self, terms: Collection[str], candidates: Dict[int, float]) -> Iterable[Tuple[float, Iterable[Tuple[int, float]]]]:
+        return [(1.0, candidates.items())]  # No cheap per-candidate bound
+
+    def rank(self, query: str, terms: Collection[str], candidates: Any, k: int) -> List[Tuple[int, float]]:
+        """
+        Best k (topic id, score) pairs, quantum noise included. Only the budgeted
+        candidates are scored, but all of them stay out of the noise-only tail:
+        a trimmed match is dropped, not ranked as if it shared no word.
+        """
+        # Like `_similarity`, a query without words scores 0 everywhere - not even noise
+        if not terms:
+            return []
+        qs = self.searcher
+        buckets = self.buckets(terms, self.budget(terms, candidates))
+        return qs._top_k(qs._scored(query, buckets, candidates, k), k)
+
+class IndexRetriever(Retriever):
+    """Inverted index lookup, scored with Jaccard similarity"""
+    def candidates(self, query: str) -> Tuple[Collection[str], Dict[int, float]]:
+        q_w = self.searcher.query_tokens(query)
+        return q_w, self.searcher._retrieve(q_w)
+
+    def bound(self, terms: Collection[str], tid: int, base: float) -> float:
+        # h shared words of a topic with p words: Jaccard is at most h / (|q| + p - h)
+        return base / (len(terms) + self.searcher.topic_sizes[tid] - base)
+
+    def generate_many(self, queries: List[str]) -> Iterator[Tuple[str, Collection[str], Any]]:
+        """Every token's posting list is walked once for the whole batch"""
+        terms: Dict[str, set] = {}
+        hits: Dict[str, Dict[int, int]] = {}
+        readers: Dict[str, List[Dict[int, int]]] = {}
+        for query in queries:
+            if query not in terms:
+                terms[query] = self.searcher.query_tokens(query)
+                hits[query] = {}
+                for w in terms[query]:
+                    readers.setdefault(w, []).append(hits[query])
+        for w, counts in readers.items():
+            for tid in self.searcher.index.get(w, ()):
+                for h in counts:
+                    h[tid] = h.get(tid, 0) + 1
+        for query in queries:
+            yield query, terms[query], hits[query]
+
+    def buckets(self, terms: Collection[str], candidates: Dict[int, float]) -> Iterable[Tuple[float, Iterable[Tuple[int, float]]]]:
+        return self.searcher._jaccard_buckets(terms, candidates)
+
+class BM25Retriever(Retriever):
+    """BM25 postings over titles and solutions"""
+    def candidates(self, query: str) -> Tuple[Collection[str], Dict[int, float]]:
+        terms = BM25Index.terms(query)
+        return terms, self.searcher.bm25.score(terms) if terms else {}
+
+class SemanticRetriever(Retriever):
+    """Nearest topic embeddings (SEMANTIC_CANDIDATES of them)"""
+    def candidates(self, query: str) -> Tuple[Collection[str], Dict[int, float]]:
+        terms = SemanticIndex.words(query)
+        return terms, self.searcher.semantic.score(query) if terms else {}
+
+class VectorRetriever(Retriever):
+    """
+    Dense NumPy scoring: every topic is a candidate, so generation produces the
+    whole score row and CANDIDATE_BUDGET does not apply
+    """
+    def generate(self, query: str) -> Tuple[Collection[str], Any]:
+        return (), self.searcher.vector.score(query)
+
+    def generate_many(self, queries: List[str]) -> Iterator[Tuple[str, Collection[str], Any]]:
+        # Score matrix rows are n_topics wide: keep each sub-batch's temporaries cache-sized (~64K cells)
+        vector = self.searcher.vector
+        rows = max(1, (1 << 16) // max(1, len(self.searcher.problems)))
+        for i in range(0, len(queries), rows):
+            batch = queries[i:i + rows]
+            for query, row in zip(batch, vector.score_batch(batch)):
+                yield query, (), row
+
+    def rank(self, query: str, terms: Collection[str], candidates: Any, k: int) -> List[Tuple[int, float]]:
+        return self.searcher.vector.top(candidates, k)
+
+class Reranker:
+    """
+    Optional third search pipeline stage: rescores the RERANK_CANDIDATES best
+    scored topics with a costlier signal, so that signal never sees the whole KB.
+    Subclasses are looked up by SEARCH_RERANKER name in RERANKERS.
+    """
+    def __init__(self, searcher: QuantumSearch):
+        self.searcher = searcher
+
+    def similarity(self, query: str, tids: List[int]) -> Sequence[float]:
+        raise NotImplementedError
+
+    def rerank(self, query: str, ranked: List[Tuple[int, float]], n: int) -> List[Tuple[int, float]]:
+        """Best n (topic id, blended score) pairs above threshold, ties in KB order"""
+        if not ranked:
+            return []
+        w, threshold = CONFIG["RERANK_WEIGHT"], CONFIG["MIN_SIMILARITY_THRESHOLD"]
+        sims = self.similarity(query, [tid for tid, _ in ranked])
+        blended = [(tid, min(1.0, (1 - w) * score + w * max(0.0, float(sim))))
+                   for (tid, score), sim in zip(ranked, sims)]
+        blended = [item for item in blended if item[1] >= threshold]
+        blended.sort(key=lambda item: (-item[1], item[0]))
+        return blended[:max(n, 0)]
+
+class SemanticReranker(Reranker):
+    """Embedding cosine similarity, e.g. to let paraphrases overtake noisy lexical matches"""
+    def similarity(self, query: str, tids: List[int]) -> Sequence[float]:
+        return self.searcher.semantic.similarity(query, tids)
+
+RETRIEVERS: Dict[str, type] = {
+    "index": IndexRetriever,
+    "numpy": VectorRetriever,
+    "bm25": BM25Retriever,
+    "semantic": SemanticRetriever,
+}
+RERANKERS: Dict[str, type] = {
+    "semantic": SemanticReranker,
+}
+
 class LLM:
     def __init__(self):
         self.templates = [
@@ -422,31 +2563,198 @@ class LLM:
             "Quantum entanglement has confused my response. Please ask again with more context."
         ]
 
+    @traced("reply")
     def reply(self, sols: List[str]) -> str:
-        if not sols:
-            return random.choice(self.fallback_responses)
-            
-        base = random.choice(self.templates).format(solution=sols[0])
-        if len(sols) > 1:
-            base += "\n\n**Additional quantum insights:**\n" + "\n".join(f"• {s}" for s in sols[1:4])
-        if len(sols) > 4:
-            base += f"\n\n*And {len(sols)-4} more quantum possibilities...*"
-            
-        return base
+        return "".join(self.reply_stream(sols))
+
+    def reply_stream(self, sols: Iterable[str]) -> Iterator[str]:
+        """
+        The reply in chunks that concatenate to `reply`: the headline solution as
+        soon as the first one is known, then each additional insight, then the trailer
+        """
+        sols = iter(sols)
+        first = next(sols, None)
+        if first is None:
+            yield quantum_choice(self.fallback_responses, "")
+            return
+
+        yield quantum_choice(self.templates, first).format(solution=first)
+        for i, s in enumerate(islice(sols, 3)):
+            yield ("\n\n**Additional quantum insights:**\n" if i == 0 else "\n") + f"• {s}"
+        more = sum(1 for _ in sols)
+        if more:
+            yield f"\n\n*And {more} more quantum possibilities...*"
+
+class ResponseCache:
+    """
+    Bounded LRU cache with TTL for search + reply results, keyed on the
+    normalized query and every setting that changes the ranking. Cleared
+    whenever the KB version changes.
+    """
+    RANKING_CONFIG = (
+        "QUANTUM_MODE", "QUANTUM_SEED", "QUANTUM_RANDOMNESS_FACTOR", "MIN_SIMILARITY_THRESHOLD", "MAX_SOLUTIONS",
+        "SEARCH_BACKEND", "BM25_K1", "BM25_B", "BM25_TITLE_WEIGHT", "FUZZY_MATCHING", "FUZZY_MIN_SIMILARITY",
+        "FUZZY_MAX_CANDIDATES", "SEMANTIC_DIM", "SEMANTIC_SEED", "SEMANTIC_TITLE_WEIGHT", "SEMANTIC_CANDIDATES",
+        "SEMANTIC_EXACT_MAX", "SEMANTIC_IVF_LISTS", "SEMANTIC_NPROBE", "SEMANTIC_LEXICON", "CANDIDATE_BUDGET",
+        "SEARCH_RERANKER", "RERANK_CANDIDATES", "RERANK_WEIGHT",
+    )
+
+    def __init__(self, max_size: int = CONFIG["CACHE_SIZE"], ttl: float = CONFIG["CACHE_TTL"]):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[Tuple, Tuple[float, str]]" = OrderedDict()
+        self.version: Optional[int] = None
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def key(cls, q: str, n: int = 5) -> Tuple:
+        """`n` is the number of matched topics the reply was built from"""
+        return (" ".join(q.lower().split()), n) + tuple(CONFIG[name] for name in cls.RANKING_CONFIG)
+
+    def sync(self, version: Optional[int]):
+        """Drop everything if the KB has been saved since the entries were cached"""
+        with self.lock:
+            if version != self.version:
+                if self.entries:
+                    self.invalidations += 1
+                self.entries.clear()
+                self.version = version
+
+    def get(self, key: Tuple) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.inc(result="hit")
+            return entry[1]
+
+    def put(self, key: Tuple, value: str):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
 
 class Chatbot:
-    def __init__(self):
-        self.kb = load_kb()
-        self.searcher = QuantumSearch(self.kb)
+    def __init__(self, kb: Optional[Dict[str, List[str]]] = None, searcher: Optional[QuantumSearch] = None,
+                 cache: Optional[ResponseCache] = None):
+        if kb is None:
+            kb, kb_file = load_kb(), CONFIG["KB_FILE"]
+        else:
+            kb_file = None
+        self.kb = kb
+        self.searcher = searcher or QuantumSearch(self.kb, kb_file)
+        self.cache = cache or ResponseCache()
         self.llm = LLM()
         self.session_start = datetime.now()
         self.session_queries = 0
 
-    def process(self, q: str) -> str:
+    def process(self, q: str, on_stage: Optional[Callable[[str, float], None]] = None) -> str:
+        return "".join(self.process_stream(q, on_stage))
+
+    def process_stream(self, q: str, on_stage: Optional[Callable[[str, float], None]] = None) -> Iterator[str]:
+        """
+        `process` as a stream of reply chunks, for UIs that render while the reply
+        is generated: the headline solution is yielded as soon as the top match is
+        ranked, so time to the first chunk is the latency the user perceives.
+        PROCESS_SECONDS is the wall time to the last chunk; the `process` span
+        (and its profile) covers only the work producing the chunks.
+        """
+        start = time.perf_counter()
+        first = True
+        try:
+            for chunk in TRACER.span_iter("process", self._reply_chunks(q, on_stage), profile=True):
+                if first:
+                    first = False
+                    FIRST_CHUNK_SECONDS.observe(time.perf_counter() - start)
+                    if TRACER.enabled:
+                        TRACER.observe("process.first_chunk", time.perf_counter() - start)
+                yield chunk
+        finally:
+            PROCESS_SECONDS.observe(time.perf_counter() - start)
+
+    def _reply_chunks(self, q: str, on_stage: Optional[Callable[[str, float], None]]) -> Iterator[str]:
         self.session_queries += 1
+        QUERIES.inc(source="chat")
+        ans = self._command(q)
+        if ans is not None:
+            yield ans
+            return
+
+        # Process query, serving repeats from the response cache
+        clock = StageClock(on_stage)
+        self.cache.sync(kb_stamp())
+        key = self.cache.key(q)
+        ans = self.cache.get(key)
+        if ans is not None:
+            self.searcher.record(q)
+            clock("cache")
+            yield ans
+            return
+        parts = []
+        sols = self.searcher.search_stream(q, clock=clock)
+        head = list(islice(sols, 1))  # Runs the ranking, so the reply span only covers the cheap expansions after it
+        for chunk in TRACER.span_iter("reply", self.llm.reply_stream(chain(head, sols))):
+            parts.append(chunk)
+            yield chunk
+        clock("render")
+        self.cache.put(key, "".join(parts))
+
+    def process_batch(self, queries: Iterable[str], n: int = 5) -> Iterator[str]:
+        """
+        Replies for many queries, yielded in input order, for offline evaluation
+        and bulk triage. Session counters, search history and the response cache
+        are left untouched; failures become their chat error text instead of
+        aborting the batch.
+        """
+        queries = list(queries)
+        QUERIES.inc(len(queries), source="batch")
+        answers: Dict[int, str] = {}
+        pending: List[str] = []
+        for i, q in enumerate(queries):
+            try:
+                ans = self._command(q)
+                if ans is None:
+                    self.searcher.check(q)
+            except ComingSoon as e:
+                ERRORS.inc(type=type(e).__name__)
+                ans = f"🚧 {e}"
+            except RuntimeError as e:
+                ERRORS.inc(type=type(e).__name__)
+                ans = f"⚠️ Quantum instability: {e}"
+            if ans is None:
+                pending.append(q)
+            else:
+                answers[i] = ans
+        results = self.searcher.search_many(pending, n)
+        for i in range(len(queries)):
+            yield answers[i] if i in answers else self.llm.reply(next(results))
+
+    def _command(self, q: str) -> Optional[str]:
+        """Reply to a special chat command, or None for a regular query"""
         ql = q.strip().lower()
-        
-        # Special commands
         if ql == "voice support":
             raise ComingSoon("🎙️ Voice Support is coming in the next quantum update.")
         if ql == "dark mode":
@@ -455,10 +2763,7 @@ class Chatbot:
             return f"📊 Quantum Stats: {self.session_queries} queries this session, {len(self.searcher.search_history)} total searches."
         if ql == "help":
             return "**Quantum Assistant Help:**\n• Describe your technical issue\n• Use 'quantum stats' for analytics\n• Try 'simulate error' for testing\n• Use clear, specific questions for best results"
-            
-        # Process query
-        sols = self.searcher.search(q)
-        return self.llm.reply(sols)
+        return None
     
     def get_session_stats(self):
         duration = datetime.now() - self.session_start
@@ -468,40 +2773,354 @@ class Chatbot:
             "start_time": self.session_start.strftime("%H:%M:%S")
         }
 
+# ===== Shared Engine =====
+@cache_resource(max_entries=1, show_spinner=False)
+def _load_engine(file: str, version: Optional[int]) -> Tuple[Dict[str, List[str]], QuantumSearch]:
+    kb = load_kb(file)
+    log.info(f"KB loaded: {len(kb)} topics (version {version})")
+    return kb, QuantumSearch(kb, file, get_search_analytics())
+
+@cache_resource(max_entries=1, show_spinner=False)
+def _attach_engine(file: str, generation: int) -> Tuple[Mapping[str, List[str]], QuantumSearch]:
+    try:
+        kb = CompiledKB(compiled_kb_path(file))
+    except (OSError, ValueError) as e:
+        log.warning(f"No published KB to attach ({e}); loading a private copy until the loader publishes one")
+        kb = load_kb(file)
+    log.info(f"KB attached: {len(kb)} topics (generation {generation})")
+    return kb, QuantumSearch(kb, file, get_search_analytics())
+
+def open_engine(file: str, stamp: Optional[int]) -> Tuple[Mapping[str, List[str]], QuantumSearch]:
+    """The engine for `kb_stamp(file)`: attached to the published KB when KB_SHARED, else loaded"""
+    return (_attach_engine if CONFIG["KB_SHARED"] else _load_engine)(file, stamp)
+
+def get_engine(file: str = CONFIG["KB_FILE"]) -> Tuple[Dict[str, List[str]], QuantumSearch]:
+    """Process-wide KB and search engine, rebuilt only when the KB changes (see `kb_stamp`)"""
+    return open_engine(file, kb_stamp(file))
+
+@cache_resource(show_spinner=False)
+def get_search_analytics() -> SearchAnalytics:
+    """Process-wide search log, handed to every engine so it survives KB reloads"""
+    return SearchAnalytics()
+
+@cache_resource(show_spinner=False)
+def get_response_cache() -> ResponseCache:
+    """Process-wide response cache shared by every session"""
+    return ResponseCache()
+
+# ===== HTTP Service =====
+class ChatService:
+    """
+    ASGI app exposing the assistant as a JSON API, without Streamlit:
+
+        POST /search  {"query": "...", "n": 5}  -> {"query": ..., "results": [...]}
+        POST /reply   {"query": "...", "n": 5}  -> {"query": ..., "reply": ..., "status": ...}
+        GET  /metrics                           -> Prometheus text exposition
+
+    One Chatbot (engine, response cache, counters) is shared by every request and
+    only touched from the event loop. Scoring runs on an executor so the loop never
+    blocks: a single search thread by default, or `workers` processes that each
+    load the KB (mapping it when compiled).
+    """
+    def __init__(self, kb_file: str = CONFIG["KB_FILE"], workers: Optional[int] = None):
+        self.kb_file = kb_file
+        self.workers = workers or CONFIG["SERVICE_WORKERS"]
+        self.bot: Optional[Chatbot] = None
+        self._version: Optional[int] = None
+        self._reload = None  # asyncio.Lock, created on the serving loop
+        self._executor = None
+        self._inflight: Dict[Tuple, "asyncio.Future"] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        if scope["path"] == "/metrics":
+            await self._send(send, 200, METRICS.exposition().encode("utf-8"), MetricsRegistry.CONTENT_TYPE)
+            return
+        routes = {"/search": self._search_endpoint, "/reply": self._reply_endpoint}
+        handler = routes.get(scope["path"])
+        if handler is None:
+            await self._send_json(send, 404, {"error": "Not found"})
+            return
+        if scope["method"] != "POST":
+            await self._send_json(send, 405, {"error": "Use POST"})
+            return
+        try:
+            body = await self._read_body(receive)
+        except OverflowError as e:
+            await self._send_json(send, 413, {"error": str(e)})
+            return
+        try:
+            payload = json.loads(body or b"{}")
+            query, n = payload["query"], payload.get("n", 5)
+            valid = isinstance(query, str) and type(n) is int and 0 < n <= 100
+        except (ValueError, KeyError, TypeError, AttributeError):  # Malformed JSON or not an object
+            valid = False
+        if not valid:
+            await self._send_json(send, 400, {"error": 'Expected {"query": str, "n": int (1-100)}'})
+            return
+        status, body = await handler(query, n)
+        await self._send_json(send, status, body)
+
+    async def _search_endpoint(self, query: str, n: int) -> Tuple[int, Dict]:
+        bot = await self._engine()
+        try:
+            results = await self._search(query, n)
+        except RuntimeError as e:
+            ERRORS.inc(type=type(e).__name__)
+            return 503, {"query": query, "error": str(e)}
+        bot.searcher.record(query)
+        return 200, {"query": query, "results": results}
+
+    async def _reply_endpoint(self, query: str, n: int) -> Tuple[int, Dict]:
+        """Same flow as `Chatbot.process`, with the search offloaded"""
+        bot = await self._engine()
+        start = time.perf_counter()
+        bot.session_queries += 1
+        QUERIES.inc(source="api")
+        try:
+            ans = bot._command(query)
+            if ans is None:
+                bot.cache.sync(self._version)
+                key = bot.cache.key(query, n)
+                ans = bot.cache.get(key)
+                if ans is None:
+                    # Identical queries arriving together share one search
+                    task = self._inflight.get(key)
+                    if task is None:
+                        task = self._inflight[key] = asyncio.ensure_future(self._answer(key, query, n))
+                    ans = await asyncio.shield(task)
+                bot.searcher.record(query)
+        except ComingSoon as e:
+            ERRORS.inc(type=type(e).__name__)
+            return 200, {"query": query, "reply": f"🚧 {e}", "status": "coming_soon"}
+        except RuntimeError as e:
+            ERRORS.inc(type=type(e).__name__)
+            return 503, {"query": query, "reply": f"⚠️ Quantum instability: {e}", "status": "error"}
+        finally:
+            PROCESS_SECONDS.observe(time.perf_counter() - start)
+        return 200, {"query": query, "reply": ans, "status": "ok"}
+
+    async def _answer(self, key: Tuple, query: str, n: int) -> str:
+        version = self._version
+        try:
+            ans = self.bot.llm.reply(await self._search(query, n))
+            # If the KB changed during the search this reply is from the old one: don't cache it as the new one's
+            if kb_stamp(self.kb_file) == version == self._version:
+                self.bot.cache.put(key, ans)
+            return ans
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _engine(self) -> Chatbot:
+        """The shared Chatbot, re-pointed at a fresh engine when the KB changes on disk"""
+        version = kb_stamp(self.kb_file)
+        if self.bot is not None and version == self._version:
+            return self.bot
+        if self._reload is None:
+            self._reload = asyncio.Lock()
+        async with self._reload:
+            if self.bot is None or version != self._version:
+                kb, searcher = await asyncio.get_running_loop().run_in_executor(
+                    None, open_engine, self.kb_file, version)
+                if self.bot is None:
+                    self.bot = Chatbot(kb, searcher)
+                else:
+                    self.bot.kb, self.bot.searcher = kb, searcher
+                self._version = version
+                self._shutdown_executor()  # Worker processes hold the old KB
+        return self.bot
+
+    async def _search(self, query: str, n: int) -> List[str]:
+        if self._executor is None:
+            if self.workers > 1:
+                kb = self.bot.kb.path if isinstance(self.bot.kb, CompiledKB) else self.bot.kb
+                self._executor = futures.ProcessPoolExecutor(self.workers, initializer=_init_batch_worker,
+                                                     initargs=(kb, self.kb_file, dict(CONFIG)))
+            else:
+                self._executor = futures.ThreadPoolExecutor(1, thread_name_prefix="qai-search")
+        loop = asyncio.get_running_loop()
+        if self.workers > 1:
+            results, seconds = await loop.run_in_executor(self._executor, _search_batch_chunk, [query], n)
+            for t in seconds:
+                SEARCH_SECONDS.observe(t)
+        else:
+            results = await loop.run_in_executor(self._executor, list, self.bot.searcher.search_many([query], n))
+        return results[0]
+
+    def _shutdown_executor(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self._engine()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self._shutdown_executor()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > CONFIG["SERVICE_MAX_BODY"]:
+                raise OverflowError("Request body too large")
+            if not message.get("more_body"):
+                return body
+
+    @classmethod
+    async def _send_json(cls, send, status: int, body: Dict):
+        await cls._send(send, status, json.dumps(body, ensure_ascii=False).encode("utf-8"),
+                        "application/json; charset=utf-8")
+
+    @staticmethod
+    async def _send(send, status: int, data: bytes, content_type: str):
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", content_type.encode()),
+                                (b"content-length", str(len(data)).encode())]})
+        await send({"type": "http.response.body", "body": data})
+
+# ASGI entry point: `uvicorn Qapp:app`
+app = ChatService()
+
+def serve(host: str = CONFIG["SERVICE_HOST"], port: int = CONFIG["SERVICE_PORT"]):
+    """Run the JSON API with uvicorn (optional dependency)"""
+    try:
+        import uvicorn
+    except ImportError:
+        log.error("The HTTP service needs uvicorn: pip install uvicorn")
+        raise SystemExit(1)
+    uvicorn.run(app, host=host, port=port, log_level="info")
+
 # ===== UI Components =====
+PIPELINE_STAGES = {
+    "candidates": "Initializing qubits...",
+    "score": "Creating superposition...",
+    "rerank": "Entangling candidates...",
+    "assemble": "Collapsing wave function...",
+    "render": "Interpreting results...",
+    "cache": "Recalling entangled state...",
+}
+
+SETTINGS_DEFAULTS = {
+    "chat_history_length": 50,
+    "show_animations": True,
+    "voice_responses": False,
+    "notification_sounds": True,
+    "desktop_alerts": False,
+}
+
+def session_history_id() -> str:
+    """This conversation's history key, kept in the URL (?chat=...) so a reload resumes it"""
+    sid = st.query_params.get("chat")
+    if not sid or not re.fullmatch(r"[0-9a-f]{32}", sid):
+        sid = uuid.uuid4().hex
+        st.query_params["chat"] = sid
+    return sid
+
+def get_history_store() -> ChatHistoryStore:
+    """This session's chat log; other sessions never read or clear it"""
+    if "history" not in st.session_state:
+        path = Path(CONFIG["HISTORY_DIR"]) / f"{session_history_id()}.jsonl"
+        st.session_state.history = ChatHistoryStore(path)
+    return st.session_state.history
+
+def push_message(role: Role, content: str):
+    """Append a message to the session and the persistent history"""
+    m = Message(role, content, datetime.now().strftime("%H:%M:%S"))
+    st.session_state.msgs.append(m)
+    get_history_store().append(m)
+
+def clear_chat():
+    st.session_state.msgs = []
+    st.session_state.feedback = {}
+    st.session_state.history_offset = 0
+    st.session_state.pop("chat_window", None)
+    get_history_store().clear()
+
+def load_older_messages():
+    """Widen the chat window by a page, pulling messages from disk once the session runs out"""
+    window = st.session_state.get("chat_window", st.session_state.chat_history_length) + CONFIG["CHAT_PAGE_SIZE"]
+    shortfall = window - len(st.session_state.msgs)
+    if shortfall > 0 and st.session_state.history_offset > 0:
+        older, st.session_state.history_offset = get_history_store().recent(
+            shortfall, st.session_state.history_offset
+        )
+        st.session_state.msgs[:0] = older
+    st.session_state.chat_window = window
+
+def answer_stream(bot: Chatbot, txt: str, on_stage: Optional[Callable[[str, float], None]] = None,
+                  outcome: Optional[List[Tuple[str, str]]] = None) -> Iterator[str]:
+    """
+    Run a chat turn, yielding reply chunks as they are generated (errors become
+    their chat text); (status state, status label) is appended to `outcome`
+    """
+    try:
+        yield from bot.process_stream(txt, on_stage)
+        result = ("complete", "Quantum analysis complete!")
+    except ComingSoon as e:
+        ERRORS.inc(type=type(e).__name__)
+        yield f"🚧 {e}"
+        result = ("complete", "Feature coming soon!")
+    except Exception as e:
+        ERRORS.inc(type=type(e).__name__)
+        yield f"⚠️ Quantum instability: {e}"
+        result = ("error", "Quantum error detected!")
+    if outcome is not None:
+        outcome.append(result)
+
 def create_problem_card(title, solutions, key):
     with st.expander(title, expanded=False):
         for i, solution in enumerate(solutions):
             st.markdown(f"{i+1}. {solution}")
         if st.button("Apply this solution", key=f"btn_{key}"):
-            st.session_state.msgs.append(Message(
-                Role.USER, f"Applied solution for {title}", datetime.now().strftime("%H:%M:%S")
-            ))
-            st.session_state.msgs.append(Message(
-                Role.BOT, f"✅ Applied solution for {title}. Let me know if you need further assistance!", 
-                datetime.now().strftime("%H:%M:%S")
-            ))
+            push_message(Role.USER, f"Applied solution for {title}")
+            push_message(Role.BOT, f"✅ Applied solution for {title}. Let me know if you need further assistance!")
             st.rerun()
 
-def generate_qr_code(data: str) -> str:
-    """Generate a QR code and return as data URL"""
+@cache_resource(show_spinner=False)
+def qr_png(data: str, fill_color: str = "#6366f1", back_color: str = "white", box_size: int = 4) -> bytes:
+    """PNG bytes of a QR code, encoded once per process and optionally cached on disk"""
+    cache_file = None
+    if CONFIG["QR_CACHE_DIR"]:
+        digest = hashlib.sha1(f"{data}|{fill_color}|{back_color}|{box_size}".encode("utf8")).hexdigest()
+        cache_file = Path(CONFIG["QR_CACHE_DIR"]) / f"{digest}.png"
+        if cache_file.exists():
+            return cache_file.read_bytes()
+
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=4,
+        box_size=box_size,
         border=4,
     )
     qr.add_data(data)
     qr.make(fit=True)
     
-    img = qr.make_image(fill_color="#6366f1", back_color="white")
+    img = qr.make_image(fill_color=fill_color, back_color=back_color)
     buffered = BytesIO()
     img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    
-    return f"data:image/png;base64,{img_str}"
+    png = buffered.getvalue()
+
+    if cache_file is not None:
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            cache_file.write_bytes(png)
+        except OSError as e:
+            log.warning(f"QR cache write failed: {e}")
+    return png
 
-def chart_quantum_process() -> go.Figure:
+def chart_quantum_process() -> "go.Figure":
     # Create a visualization of quantum process
     steps = ['Init', 'Superposition', 'Entanglement', 'Measurement', 'Result']
     values = [0, 4, 7, 9, 10]
@@ -526,9 +3145,8 @@ def chart_quantum_process() -> go.Figure:
     
     return fig
 
-def chart_usage_metrics(bot: Chatbot):
+def chart_usage_metrics(stats: Dict):
     # Create usage metrics
-    stats = bot.searcher.get_search_stats()
     
     fig = go.Figure()
     
@@ -552,10 +3170,17 @@ def chart_usage_metrics(bot: Chatbot):
 def ui_chat(bot: Chatbot):
     st.markdown('<div class="sub-header">💬 Quantum Chat Assistant</div>', unsafe_allow_html=True)
     
-    # Chat container with custom styling
+    # Only the last `window` messages are rendered; older ones are paged in on demand
+    msgs = st.session_state.msgs
+    window = st.session_state.get("chat_window", st.session_state.chat_history_length)
+    feedback = st.session_state.feedback
     chat_container = st.container(height=CONFIG["CHAT_HEIGHT"])
     with chat_container:
-        for i, m in enumerate(st.session_state.msgs):
+        if len(msgs) > window or st.session_state.history_offset > 0:
+            if st.button("⬆ Load older messages", key="load_older"):
+                load_older_messages()
+                st.rerun()
+        for m in msgs[-window:]:
             if m.role == Role.USER:
                 st.markdown(f"""
                 <div class="chat-user">
@@ -573,15 +3198,15 @@ def ui_chat(bot: Chatbot):
                     </div>
                     """, unsafe_allow_html=True)
                 with col2:
-                    if m.helpful is None:
-                        if st.button("✓", key=f"helpful_{i}"):
-                            m.helpful = True
+                    if m.id not in feedback:
+                        if st.button("✓", key=f"helpful_{m.id}"):
+                            feedback[m.id] = True
                             st.rerun()
-                        if st.button("✗", key=f"unhelpful_{i}"):
-                            m.helpful = False
+                        if st.button("✗", key=f"unhelpful_{m.id}"):
+                            feedback[m.id] = False
                             st.rerun()
                     else:
-                        st.markdown("✓" if m.helpful else "✗")
+                        st.markdown("✓" if feedback[m.id] else "✗")
     
     # Chat input with options
     input_col, button_col = st.columns([0.8, 0.2])
@@ -589,41 +3214,37 @@ def ui_chat(bot: Chatbot):
         txt = st.chat_input("Describe your quantum issue...")
     with button_col:
         if st.button("Clear Chat"):
-            st.session_state.msgs = []
+            clear_chat()
             st.rerun()
     
     if txt:
-        st.session_state.msgs.append(Message(Role.USER, txt, datetime.now().strftime("%H:%M:%S")))
+        push_message(Role.USER, txt)
         
-        # Show quantum processing animation
-        with st.status("Quantum processing...", expanded=False) as status:
-            st.write("Initializing qubits...")
-            progress_bar = st.progress(0)
-            
-            for i in range(CONFIG["PROGRESS_STEPS"]):
-                time.sleep(CONFIG["SIMULATION_DELAY"] / CONFIG["PROGRESS_STEPS"])
-                progress_bar.progress(i + 1)
-                
-                if i == 20:
-                    st.write("Creating superposition...")
-                elif i == 40:
-                    st.write("Entangling quantum states...")
-                elif i == 60:
-                    st.write("Collapsing wave function...")
-                elif i == 80:
-                    st.write("Interpreting results...")
-            
-            try:
-                ans = bot.process(txt)
-                status.update(label="Quantum analysis complete!", state="complete")
-            except ComingSoon as e:
-                ans = f"🚧 {e}"
-                status.update(label="Feature coming soon!", state="complete")
-            except Exception as e:
-                ans = f"⚠️ Quantum instability: {e}"
-                status.update(label="Quantum error detected!", state="error")
+        # Progress follows the real pipeline stages as they complete
+        status = None
+        if st.session_state.get("show_animations", True):
+            status = st.status("Quantum processing...", expanded=False)
+            progress_bar = status.progress(0)
+        done = []
+
+        def on_stage(stage: str, seconds: float):
+            if status is None:
+                return
+            done.append(stage)
+            status.write(f"{PIPELINE_STAGES.get(stage, stage)} {seconds * 1000:.1f} ms")
+            progress_bar.progress(1.0 if stage in ("render", "cache") else min(1.0, len(done) / 4))
+
+        # Stream the reply into the chat as it is generated: the headline shows up
+        # as soon as the top match is ranked, the insights follow
+        outcome: List[Tuple[str, str]] = []
+        with chat_container:
+            st.markdown("**Quantum AI**")
+            ans = st.write_stream(answer_stream(bot, txt, on_stage, outcome))
+        if status is not None:
+            state, label = outcome[0]
+            status.update(label=label, state=state)
         
-        st.session_state.msgs.append(Message(Role.BOT, ans, datetime.now().strftime("%H:%M:%S")))
+        push_message(Role.BOT, ans)
         st.rerun()
 
 def ui_kb(bot: Chatbot):
@@ -712,12 +3333,19 @@ def ui_analytics(bot: Chatbot):
         st.metric("Recent Searches", search_stats["recent"])
         st.markdown('</div>', unsafe_allow_html=True)
     
+    # Response cache
+    cache_stats = bot.cache.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Cache Hit Rate", f"{cache_stats['hit_rate']:.0%}")
+    col2.metric("Cache Hits / Misses", f"{cache_stats['hits']} / {cache_stats['misses']}")
+    col3.metric("Cache Evictions", cache_stats["evictions"])
+    col4.metric("Cache Entries", f"{cache_stats['size']} / {bot.cache.max_size}")
+    
     # Charts
-    st.plotly_chart(chart_usage_metrics(bot), use_container_width=True)
+    st.plotly_chart(chart_usage_metrics(search_stats), use_container_width=True)
     
     # Trending queries
     st.subheader("Trending Queries")
-    search_stats = bot.searcher.get_search_stats()
     if search_stats["trending"]:
         for query, count in search_stats["trending"]:
             st.markdown(f"- **{query}** ({count} searches)")
@@ -725,8 +3353,8 @@ def ui_analytics(bot: Chatbot):
         st.info("No trending queries yet. Start chatting to generate analytics!")
     
     # Feedback analysis
-    helpful_count = sum(1 for m in st.session_state.msgs if m.role == Role.BOT and m.helpful is True)
-    unhelpful_count = sum(1 for m in st.session_state.msgs if m.role == Role.BOT and m.helpful is False)
+    helpful_count = sum(1 for v in st.session_state.feedback.values() if v)
+    unhelpful_count = len(st.session_state.feedback) - helpful_count
     total_feedback = helpful_count + unhelpful_count
     
     if total_feedback > 0:
@@ -739,6 +3367,32 @@ def ui_analytics(bot: Chatbot):
         fig = px.pie(feedback_data, values="Count", names="Type", 
                     color_discrete_sequence=["#6366f1", "#ef4444"])
         st.plotly_chart(fig, use_container_width=True)
+    
+    # Pipeline latency
+    st.subheader("Pipeline Latency")
+    col1, col2 = st.columns(2)
+    TRACER.enabled = col1.checkbox("Record spans", value=TRACER.enabled)
+    rate = col2.slider("cProfile sample rate", 0.0, 1.0, float(TRACER.profile_rate), 0.05)
+    TRACER.profile_rate = rate
+    spans = TRACER.summary()
+    if spans:
+        latency_data = pd.DataFrame([
+            {"Span": name, "Count": s["count"], "p50 (ms)": s["p50"] * 1e3,
+             "p95 (ms)": s["p95"] * 1e3, "p99 (ms)": s["p99"] * 1e3, "Max (ms)": s["max"] * 1e3}
+            for name, s in spans.items()
+        ])
+        st.dataframe(latency_data.round(3), use_container_width=True, hide_index=True)
+        col1, col2 = st.columns(2)
+        col1.download_button("⬇️ Export JSON", TRACER.export_json(), file_name="qai_latency.json",
+                             mime="application/json")
+        if col2.button("Reset latency stats"):
+            TRACER.reset()
+            st.rerun()
+    else:
+        st.info("No spans recorded yet.")
+    if rate > 0:
+        with st.expander("cProfile (sampled chat turns)"):
+            st.code(TRACER.profile_report(), language="text")
 
 def ui_settings():
     st.markdown('<div class="sub-header">⚙️ Quantum Settings</div>', unsafe_allow_html=True)
@@ -750,14 +3404,14 @@ def ui_settings():
     
     # Chat settings
     st.subheader("Chat Preferences")
-    st.slider("Chat History Length", 10, 100, 50, key="chat_history_length")
-    st.checkbox("Show Quantum Animations", value=True, key="show_animations")
-    st.checkbox("Voice Responses (when available)", value=False, key="voice_responses")
+    st.slider("Chat History Length", 10, 100, key="chat_history_length")
+    st.checkbox("Show Quantum Animations", key="show_animations")
+    st.checkbox("Voice Responses (when available)", key="voice_responses")
     
     # Notification settings
     st.subheader("Notifications")
-    st.checkbox("Enable Notification Sounds", value=True, key="notification_sounds")
-    st.checkbox("Desktop Alerts", value=False, key="desktop_alerts")
+    st.checkbox("Enable Notification Sounds", key="notification_sounds")
+    st.checkbox("Desktop Alerts", key="desktop_alerts")
     
     if st.button("Save Settings"):
         st.success("Settings saved successfully!")
@@ -765,8 +3419,7 @@ def ui_settings():
     # QR code for mobile access
     st.subheader("Mobile Access")
     st.markdown("Scan this QR code to access Quantum AI Assistant on your mobile device")
-    qr_img = generate_qr_code("https://quantum-ai-assistant.streamlit.app")
-    st.image(qr_img, caption="Quantum AI Assistant Mobile QR Code", width=200)
+    st.image(qr_png(CONFIG["APP_URL"]), caption="Quantum AI Assistant Mobile QR Code", width=200)
 
 def ui_about():
     st.markdown('<div class="sub-header">🌌 About Quantum AI Assistant</div>', unsafe_allow_html=True)
@@ -815,10 +3468,13 @@ def ui_about():
 # ===== Main =====
 def main():
     # Initialize session state
-    if "msgs" not in st.session_state:
-        st.session_state.msgs = []
     if "theme" not in st.session_state:
         st.session_state.theme = CONFIG["THEMES"][0]
+    # Settings widgets drop their state while the Settings page isn't shown; re-assigning keeps it
+    for key, default in SETTINGS_DEFAULTS.items():
+        st.session_state[key] = st.session_state.get(key, default)
+    if "feedback" not in st.session_state:
+        st.session_state.feedback = {}  # Message id -> helpful?
     
     # Setup page
     st.set_page_config(
@@ -830,9 +3486,20 @@ def main():
     
     # Inject custom CSS
     inject_custom_css()
+
+    if "msgs" not in st.session_state:
+        # Only the most recent window of this conversation's history is loaded
+        st.session_state.msgs, st.session_state.history_offset = get_history_store().recent(
+            st.session_state.chat_history_length
+        )
     
-    # Initialize chatbot
-    bot = Chatbot()
+    # Shared engine is loaded once per process; the chatbot (session counters) is per user
+    kb, searcher = get_engine()
+    if "bot" not in st.session_state:
+        st.session_state.bot = Chatbot(kb, searcher, get_response_cache())
+    bot = st.session_state.bot
+    if bot.searcher is not searcher:  # KB file changed on disk
+        bot.kb, bot.searcher = kb, searcher
     
     # Sidebar
     with st.sidebar:
@@ -857,17 +3524,12 @@ def main():
         # Quick actions
         st.markdown("**⚡ Quick Actions**")
         if st.button("Clear Chat History", use_container_width=True):
-            st.session_state.msgs = []
+            clear_chat()
             st.rerun()
             
         if st.button("Quantum Diagnostics", use_container_width=True):
-            st.session_state.msgs.append(Message(
-                Role.USER, "Run diagnostics", datetime.now().strftime("%H:%M:%S")
-            ))
-            st.session_state.msgs.append(Message(
-                Role.BOT, "✅ Quantum systems nominal. All circuits functioning within parameters.", 
-                datetime.now().strftime("%H:%M:%S")
-            ))
+            push_message(Role.USER, "Run diagnostics")
+            push_message(Role.BOT, "✅ Quantum systems nominal. All circuits functioning within parameters.")
             st.rerun()
             
         st.markdown("---")
@@ -876,18 +3538,14 @@ def main():
         st.markdown("**🔍 Common Problems**")
         problem_col1, problem_col2 = st.columns(2)
         
-        common_problems = list(bot.kb.keys())[:6]  # First 6 problems
+        common_problems = list(islice(bot.kb, 6))  # First 6 problems
         for i, problem in enumerate(common_problems):
             col = problem_col1 if i % 2 == 0 else problem_col2
             with col:
                 if st.button(problem.title(), key=f"shortcut_{problem}"):
-                    st.session_state.msgs.append(Message(
-                        Role.USER, problem, datetime.now().strftime("%H:%M:%S")
-                    ))
+                    push_message(Role.USER, problem)
                     ans = bot.process(problem)
-                    st.session_state.msgs.append(Message(
-                        Role.BOT, ans, datetime.now().strftime("%H:%M:%S")
-                    ))
+                    push_message(Role.BOT, ans)
                     st.rerun()
         
         st.markdown("---")
@@ -903,22 +3561,31 @@ def main():
         
         # QR code for mobile
         st.markdown("**📱 Mobile Access**")
-        qr_img = generate_qr_code("https://quantum-ai-assistant.streamlit.app")
-        st.image(qr_img, caption="Scan for mobile access", use_column_width=True)
-    
-    # Main content area
-    if nav == Nav.CHAT.value:
-        ui_chat(bot)
-    elif nav == Nav.KNOWLEDGE.value:
-        ui_kb(bot)
-    elif nav == Nav.QUANTUM.value:
-        ui_quantum()
-    elif nav == Nav.ANALYTICS.value:
-        ui_analytics(bot)
-    elif nav == Nav.SETTINGS.value:
-        ui_settings()
-    elif nav == Nav.ABOUT.value:
-        ui_about()
+        st.image(qr_png(CONFIG["APP_URL"]), caption="Scan for mobile access", use_column_width=True)
+    
+    # Main content area (timed as a "view.<name>" span: Streamlit rendering included)
+    with TRACER.span(f"view.{nav}"):
+        if nav == Nav.CHAT.value:
+            ui_chat(bot)
+        elif nav == Nav.KNOWLEDGE.value:
+            ui_kb(bot)
+        elif nav == Nav.QUANTUM.value:
+            ui_quantum()
+        elif nav == Nav.ANALYTICS.value:
+            ui_analytics(bot)
+        elif nav == Nav.SETTINGS.value:
+            ui_settings()
+        elif nav == Nav.ABOUT.value:
+            ui_about()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if sys.argv[1:2] == ["compile-kb"]:
+        compile_kb(*sys.argv[2:3])
+    elif sys.argv[1:2] == ["publish-kb"]:
+        publish_kb(*sys.argv[2:3])
+    elif sys.argv[1:2] == ["kb-loader"]:
+        run_kb_loader(*sys.argv[2:3])
+    elif sys.argv[1:2] == ["serve"]:
+        serve(*sys.argv[2:3], *map(int, sys.argv[3:4]))
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""
+Batch search: one `search` call per query vs. `search_many` in-process and on a process pool
+
+Usage: python benchmarks/bench_batch.py [sizes...]
+"""
+
+import sys, time
+import common
+from Qapp import CONFIG, QuantumSearch
+
+N_QUERIES = 20_000
+
+def per_query_ms(fn, n: int) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1e3 / n
+
+def main(sizes):
+    saved = CONFIG["BATCH_POOL_THRESHOLD"]
+    print(f"{'topics':>8} {'loop ms/q':>10} {'batch ms/q':>11} {'pool ms/q':>10}")
+    try:
+        for size in sizes:
+            kb = common.synthetic_kb(size)
+            qs = QuantumSearch(kb)
+            queries = common.sample_queries(kb, N_QUERIES)
+            loop = per_query_ms(lambda: [qs.search(q) for q in queries], len(queries))
+            qs.search_history.clear()
+            CONFIG["BATCH_POOL_THRESHOLD"] = len(queries) + 1
+            batch = per_query_ms(lambda: list(qs.search_many(queries)), len(queries))
+            CONFIG["BATCH_POOL_THRESHOLD"] = 0
+            pool = per_query_ms(lambda: list(qs.search_many(queries)), len(queries))
+            print(f"{size:>8} {loop:>10.3f} {batch:>11.3f} {pool:>10.3f}")
+    finally:
+        CONFIG["BATCH_POOL_THRESHOLD"] = saved
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000])
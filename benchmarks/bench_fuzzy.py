@@ -0,0 +1,59 @@
+"""
+Typo-tolerant (trigram) matching vs. exact token matching: latency and recall@1
+
+Usage: python benchmarks/bench_fuzzy.py [sizes...]
+"""
+
+import random, sys
+import common
+from Qapp import CONFIG, QuantumSearch
+
+def add_typo(word: str, rng: random.Random) -> str:
+    """One deletion, substitution, insertion or transposition"""
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return word[:i] + word[i + 1:]
+    if kind == 1:
+        return word[:i] + rng.choice("aeioustrn") + word[i + 1:]
+    if kind == 2:
+        return word[:i] + rng.choice("aeioustrn") + word[i:]
+    return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+
+def typo_queries(kb, n: int = 200, seed: int = 5):
+    """(query, intended topic) pairs with a typo in one word of the topic"""
+    rng = random.Random(seed)
+    pairs = []
+    for topic in rng.sample(list(kb), min(n, len(kb))):
+        words = topic.split()
+        i = rng.randrange(len(words))
+        words[i] = add_typo(words[i], rng)
+        pairs.append((" ".join(words), topic))
+    return pairs
+
+def run(qs: QuantumSearch, pairs, fuzzy: bool):
+    CONFIG["FUZZY_MATCHING"] = fuzzy
+    hits = sum(1 for q, topic in pairs if (qs.search(q) or [""])[0].endswith(f"for {topic}"))
+    latency = common.timeit(qs.search, [q for q, _ in pairs])
+    return latency, hits / len(pairs)
+
+def main(sizes):
+    saved = CONFIG["QUANTUM_RANDOMNESS_FACTOR"], CONFIG["FUZZY_MATCHING"]
+    CONFIG["QUANTUM_RANDOMNESS_FACTOR"] = 0.0  # Recall of the ranking itself, not of the noise
+    print(f"{'topics':>8} {'exact ms':>9} {'exact recall':>13} {'fuzzy ms':>9} {'fuzzy recall':>13}")
+    try:
+        for size in sizes:
+            kb = common.synthetic_kb(size)
+            qs = QuantumSearch(kb)
+            pairs = typo_queries(kb)
+            qs.trigrams  # Build outside the timed loop
+            exact_ms, exact_recall = run(qs, pairs, fuzzy=False)
+            fuzzy_ms, fuzzy_recall = run(qs, pairs, fuzzy=True)
+            print(f"{size:>8} {exact_ms * 1e3:>9.3f} {exact_recall:>13.1%} {fuzzy_ms * 1e3:>9.3f} {fuzzy_recall:>13.1%}")
+    finally:
+        CONFIG["QUANTUM_RANDOMNESS_FACTOR"], CONFIG["FUZZY_MATCHING"] = saved
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000])
@@ -0,0 +1,51 @@
+"""
+Cold-start cost of `import Qapp`, from `python -X importtime`: total time, the
+slowest top-level imports, and whether any heavy UI/numeric dependency was loaded
+
+Usage: python benchmarks/bench_import.py [--json] [--top N]
+"""
+
+import json, subprocess, sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY = ["streamlit", "plotly", "pandas", "numpy", "qrcode", "streamlit_option_menu"]
+
+def importtime(code: str = "import Qapp"):
+    """(module, self us, cumulative us, depth) rows for every import `code` triggers"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+def main(as_json: bool, top: int):
+    rows = importtime()
+    roots = [r for r in rows if r[3] == 0]
+    modules = {r[0] for r in rows}
+    report = {
+        "total_ms": sum(r[2] for r in roots) / 1e3,
+        "qapp_ms": next((r[2] for r in roots if r[0] == "Qapp"), 0) / 1e3,
+        "modules": len(rows),
+        "heavy_loaded": [m for m in HEAVY if m in modules],
+        "slowest": [{"module": r[0], "cumulative_ms": r[2] / 1e3}
+                    for r in sorted(roots, key=lambda r: -r[2])[:top]],
+    }
+    if as_json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"import Qapp: {report['qapp_ms']:.1f} ms ({report['total_ms']:.1f} ms incl. interpreter startup imports), "
+          f"{report['modules']} modules")
+    print(f"heavy dependencies loaded: {', '.join(report['heavy_loaded']) or 'none'}")
+    for r in report["slowest"]:
+        print(f"  {r['cumulative_ms']:>8.2f} ms  {r['module']}")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    top = int(args[args.index("--top") + 1]) if "--top" in args else 10
+    main("--json" in args, top)
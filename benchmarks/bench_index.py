@@ -0,0 +1,49 @@
+"""
+Inverted index and NumPy backends vs. linear scan for QuantumSearch.search
+
+Usage: python benchmarks/bench_index.py [sizes...]
+"""
+
+import sys
+import common
+from Qapp import CONFIG, QuantumSearch
+
+def linear_search(qs: QuantumSearch, query: str, n: int = 5):
+    """The pre-index ranking: `_similarity` over every topic"""
+    scored = [x for x in qs._scan(query) if x[1] >= CONFIG["MIN_SIMILARITY_THRESHOLD"]]
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return qs._expand(scored[:n])
+
+def with_backend(qs: QuantumSearch, backend: str):
+    def search(query: str):
+        CONFIG["SEARCH_BACKEND"] = backend
+        return qs.search(query)
+    return search
+
+def check_identical(qs: QuantumSearch, queries):
+    """With quantum noise off every backend must return exactly the linear scan's solutions"""
+    saved = CONFIG["QUANTUM_RANDOMNESS_FACTOR"], CONFIG["SEARCH_BACKEND"], CONFIG["FUZZY_MATCHING"]
+    CONFIG["QUANTUM_RANDOMNESS_FACTOR"], CONFIG["FUZZY_MATCHING"] = 0.0, False
+    try:
+        for backend in ("index", "numpy"):
+            search = with_backend(qs, backend)
+            for q in queries:
+                assert search(q) == linear_search(qs, q), f"{backend} ranking differs for {q!r}"
+    finally:
+        CONFIG["QUANTUM_RANDOMNESS_FACTOR"], CONFIG["SEARCH_BACKEND"], CONFIG["FUZZY_MATCHING"] = saved
+
+def main(sizes):
+    print(f"{'topics':>8} {'linear ms':>10} {'indexed ms':>11} {'numpy ms':>9} {'speedup':>8}")
+    for size in sizes:
+        kb = common.synthetic_kb(size)
+        qs = QuantumSearch(kb)
+        queries = common.sample_queries(kb)
+        check_identical(qs, queries)
+        linear = common.timeit(lambda q: linear_search(qs, q), queries[:20])
+        indexed = common.timeit(with_backend(qs, "index"), queries)
+        vector = common.timeit(with_backend(qs, "numpy"), queries)
+        CONFIG["SEARCH_BACKEND"] = "index"
+        print(f"{size:>8} {linear * 1e3:>10.2f} {indexed * 1e3:>11.3f} {vector * 1e3:>9.3f} {linear / indexed:>7.0f}x")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000])
@@ -0,0 +1,111 @@
+"""
+Semantic backend: paraphrase recall@1 on the default KB against the lexical
+backends, then exact vs. IVF (approximate) latency and top-1 agreement at scale
+
+Recall is reported twice: on paraphrases written with the concept lexicon's own
+words (in-lexicon, an upper bound), and on a held-out set that uses none of them
+
+Usage: python benchmarks/bench_semantic.py [sizes...]
+"""
+
+import os, sys, tempfile, time
+import common
+from Qapp import CONFIG, QuantumSearch, SemanticIndex, load_kb
+
+# (paraphrase with little or no word overlap, intended topic), worded with lexicon entries
+IN_LEXICON = [
+    ("laptop is sluggish", "slow computer"),
+    ("my pc is really laggy", "slow computer"),
+    ("wireless keeps dropping", "wifi not connecting"),
+    ("forgot my login", "password reset"),
+    ("iphone gets hot", "phone overheating"),
+    ("cellphone charge dies quickly", "battery drains fast"),
+    ("microphone muted in teams call", "zoom mic not working"),
+    ("webcam pictures fuzzy", "camera blurry"),
+    ("storage full", "disk space low"),
+    ("access forbidden opening document", "file permission denied"),
+    ("gmail account compromised", "email hacked"),
+    ("app keeps freezing", "software crashing"),
+    ("rdp is delayed", "remote desktop lag"),
+    ("modulenotfounderror when running script", "python import error"),
+    ("mailbox not updating", "outlook not syncing"),
+    ("airpods won't pair", "bluetooth issue"),
+]
+
+# Same task, no word the lexicon maps (checked by lexicon_words before running)
+HELD_OUT = [
+    ("task manager shows high cpu", "slow computer"),
+    ("adapter never gets an ip address", "wifi not connecting"),
+    ("2fa push request never arrives", "password reset"),
+    ("gets scorching during gaming", "phone overheating"),
+    ("percentage falls by lunchtime", "battery drains fast"),
+    ("input level stays silent", "zoom mic not working"),
+    ("shots look smudged through dirty glass", "camera blurry"),
+    ("recycle bin huge and windirstat shows no room", "disk space low"),
+    ("need chmod or take ownership", "file permission denied"),
+    ("keylogger found and contacts warned", "email hacked"),
+    ("event viewer shows exception codes", "software crashing"),
+    ("lower color depth because session is choppy", "remote desktop lag"),
+    ("cannot find package in virtual environment", "python import error"),
+    ("ost file corrupted", "outlook not syncing"),
+    ("tray icon gone and device not discoverable", "bluetooth issue"),
+    ("spooler queue jammed", "printer offline"),
+    ("#VALUE and #REF everywhere", "excel formula error"),
+    ("markers like <<<<<<< left in files", "git merge conflict"),
+    ("isp outage or stale winsock catalog", "no internet connection"),
+]
+
+def lexicon_words(query):
+    """Words of `query` the concept lexicon knows, as written or after stemming"""
+    concepts, _, _ = SemanticIndex.lexicon()
+    known = set(concepts) | set(concepts.values())
+    return [w for w in SemanticIndex.WORD.findall(query.lower())
+            if w in known or any(w.endswith(s) and w[:-len(s)] in known for s in ("ing", "ed", "es", "s"))]
+
+def recall(qs, kb, pairs):
+    top = [qs.search(q, 1) for q, _ in pairs]
+    return sum(1 for found, (_, topic) in zip(top, pairs) if found and found[0].endswith(kb[topic][0])) / len(pairs)
+
+def paraphrase_recall():
+    leaks = {q: words for q, _ in HELD_OUT if (words := lexicon_words(q))}
+    if leaks:
+        raise SystemExit(f"held-out paraphrases use lexicon words: {leaks}")
+    kb = load_kb(os.path.join(tempfile.gettempdir(), "missing-kb.json"))  # Built-in default KB
+    print(f"{'backend':>9} {'in-lexicon':>11} {'held-out':>9}")
+    for backend in ("index", "bm25", "semantic"):
+        CONFIG["SEARCH_BACKEND"] = backend
+        qs = QuantumSearch(kb)
+        print(f"{backend:>9} {recall(qs, kb, IN_LEXICON):>11.0%} {recall(qs, kb, HELD_OUT):>9.0%}")
+
+def ann_vs_exact(sizes):
+    print(f"\n{'topics':>8} {'build s':>8} {'ivf s':>6} {'exact ms':>9} {'ivf ms':>7} {'top-1 agree':>12}")
+    for size in sizes:
+        kb = common.synthetic_kb(size)
+        queries = common.sample_queries(kb, 200)
+        start = time.perf_counter()
+        index = SemanticIndex.build(kb, list(kb))
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        index.ivf = SemanticIndex.train_ivf(index.matrix)
+        train = time.perf_counter() - start
+
+        CONFIG["SEMANTIC_EXACT_MAX"] = len(kb)
+        exact_ms = common.timeit(index.score, queries) * 1e3
+        exact = [max(index.score(q).values(), default=0.0) for q in queries]
+        CONFIG["SEMANTIC_EXACT_MAX"] = 0
+        ivf_ms = common.timeit(index.score, queries) * 1e3
+        approx = [max(index.score(q).values(), default=0.0) for q in queries]
+        agree = sum(1 for a, e in zip(approx, exact) if abs(a - e) < 1e-6) / len(queries)
+        print(f"{size:>8} {build:>8.1f} {train:>6.1f} {exact_ms:>9.2f} {ivf_ms:>7.2f} {agree:>12.0%}")
+
+def main(sizes):
+    saved = dict(CONFIG)
+    CONFIG["QUANTUM_RANDOMNESS_FACTOR"] = 0.0  # Recall of the ranking itself, not of the noise
+    try:
+        paraphrase_recall()
+        ann_vs_exact(sizes)
+    finally:
+        CONFIG.update(saved)
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000])
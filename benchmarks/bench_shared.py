@@ -0,0 +1,73 @@
+"""
+Shared KB mode: per-worker private memory and start-up time when every worker
+loads its own KB copy vs. attaching the published compiled KB, for the index
+backend (with a fuzzy-corrected query) and BM25, plus how quickly a worker
+picks up a new generation after `save_kb` + publish
+
+Usage: python benchmarks/bench_shared.py [topics] [workers]
+"""
+
+import json, os, subprocess, sys, tempfile, time
+import common
+from Qapp import CONFIG, get_engine, publish_kb, save_kb
+
+def private_kib() -> int:
+    """Memory only this process maps (Linux): what multiplies with the worker count"""
+    with open("/proc/self/smaps_rollup") as f:
+        fields = dict(line.split(":", 1) for line in f if ":" in line)
+    return sum(int(fields[k].split()[0]) for k in ("Private_Clean", "Private_Dirty"))
+
+def worker(file: str, shared: bool, backend: str):
+    CONFIG["KB_SHARED"] = shared
+    CONFIG["SEARCH_BACKEND"] = backend
+    base = private_kib()
+    start = time.perf_counter()
+    kb, searcher = get_engine(file)
+    searcher.search("wifi not connecting")
+    searcher.search("wifi not conecting")  # Typo: the index backend corrects it through the trigram index
+    print(json.dumps({"start_ms": (time.perf_counter() - start) * 1e3, "private_mib": (private_kib() - base) / 1024}))
+
+def spawn(file: str, shared: bool, backend: str, n: int):
+    procs = [subprocess.Popen([sys.executable, __file__, "--worker", file, str(int(shared)), backend],
+                              stdout=subprocess.PIPE)
+             for _ in range(n)]
+    return [json.loads(p.communicate()[0]) for p in procs]
+
+def main(topics: int, workers: int):
+    kb = common.synthetic_kb(topics)
+    print(f"{topics} topics, {workers} workers, FUZZY_MATCHING={CONFIG['FUZZY_MATCHING']}\n")
+    print(f"{'backend':>8} {'mode':>8} {'start ms':>9} {'private MiB/worker':>19} {'total MiB':>10}")
+    for backend in ("index", "bm25"):
+        CONFIG["SEARCH_BACKEND"] = backend  # What publish_kb prebuilds sidecars for
+        with tempfile.TemporaryDirectory() as tmp:
+            file = os.path.join(tmp, "kb.json")
+            save_kb(kb, file)
+            for shared in (False, True):
+                if shared:  # Before publishing, private workers have no compiled KB or sidecar to fall back on
+                    publish_kb(file)
+                rows = spawn(file, shared, backend, workers)
+                start_ms = sum(r["start_ms"] for r in rows) / len(rows)
+                mib = sum(r["private_mib"] for r in rows)
+                print(f"{backend:>8} {'shared' if shared else 'private':>8} {start_ms:>9.1f} "
+                      f"{mib / len(rows):>19.1f} {mib:>10.1f}")
+
+    CONFIG["SEARCH_BACKEND"], CONFIG["KB_SHARED"] = "index", True
+    with tempfile.TemporaryDirectory() as tmp:
+        file = os.path.join(tmp, "kb.json")
+        save_kb(kb, file)
+        publish_kb(file)
+        _, before = get_engine(file)
+        kb["freshly added topic"] = ["New solution"]
+        save_kb(kb, file)
+        publish_kb(file)
+        start = time.perf_counter()
+        _, after = get_engine(file)
+        print(f"\nre-attach after publish: {(time.perf_counter() - start) * 1e3:.1f} ms, "
+              f"new topic visible: {'freshly added topic' in after.kb and after is not before}")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker(sys.argv[2], sys.argv[3] == "1", sys.argv[4])
+    else:
+        args = [int(a) for a in sys.argv[1:]]
+        main(*(args + [200_000, 4][len(args):]))
@@ -0,0 +1,51 @@
+"""
+Streaming heap top-k vs. scoring every candidate and fully sorting
+
+Usage: python benchmarks/bench_topk.py [sizes...]
+"""
+
+import random, sys, tracemalloc
+import common
+from Qapp import CONFIG, QuantumSearch
+
+def full_sort(qs: QuantumSearch, query: str, n: int = 5):
+    """The pre-heap ranking: score every candidate, filter, sort, slice"""
+    q_w = qs.query_tokens(query)
+    hits = qs._retrieve(q_w)
+    scored = [x for _, items in qs._jaccard_buckets(q_w, hits) for x in items]
+    scored = [(tid, min(1.0, j + CONFIG["QUANTUM_RANDOMNESS_FACTOR"] * random.random())) for tid, j in scored]
+    scored.extend(qs._noise_tail(n, hits))
+    scored = [x for x in scored if x[1] >= CONFIG["MIN_SIMILARITY_THRESHOLD"]]
+    scored.sort(key=lambda x: (-x[1], x[0]))
+    return scored[:n]
+
+def heap_top_k(qs: QuantumSearch, query: str, n: int = 5):
+    q_w = qs.query_tokens(query)
+    hits = qs._retrieve(q_w)
+    return qs._top_k(qs._scored(query, qs._jaccard_buckets(q_w, hits), hits, n), n)
+
+def peak_kib(fn, queries) -> float:
+    """Largest single-query allocation peak"""
+    peak = 0
+    for q in queries:
+        tracemalloc.start()
+        fn(q)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return peak / 1024
+
+def main(sizes):
+    # Half the topics end in "not working", as helpdesk titles often do, so
+    # queries using those words have a candidate for most of the KB
+    print(f"{'topics':>8} {'sort ms':>8} {'heap ms':>8} {'sort KiB':>9} {'heap KiB':>9}")
+    for size in sizes:
+        kb = {(f"{t} not working" if i % 2 else t): s for i, (t, s) in enumerate(common.synthetic_kb(size).items())}
+        qs = QuantumSearch(kb)
+        queries = [f"{t} not working" for t in list(kb)[:100:2]]
+        sort_fn = lambda q: full_sort(qs, q)
+        heap_fn = lambda q: heap_top_k(qs, q)
+        print(f"{size:>8} {common.timeit(sort_fn, queries) * 1e3:>8.3f} {common.timeit(heap_fn, queries) * 1e3:>8.3f}"
+              f" {peak_kib(sort_fn, queries[:20]):>9.1f} {peak_kib(heap_fn, queries[:20]):>9.1f}")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
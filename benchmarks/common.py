@@ -0,0 +1,53 @@
+"""
+Shared helpers for the Quantum AI Assistant benchmarks
+"""
+
+import random, sys, time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# Benchmarks run from the repo root or from this folder
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+WORDS = [
+    "password", "reset", "slow", "computer", "wifi", "not", "connecting", "bluetooth",
+    "issue", "printer", "offline", "excel", "formula", "error", "zoom", "mic",
+    "working", "phone", "overheating", "camera", "blurry", "battery", "drains", "fast",
+    "outlook", "syncing", "vpn", "remote", "desktop", "lag", "python", "import",
+    "git", "merge", "conflict", "docker", "build", "failed", "disk", "space",
+    "low", "file", "permission", "denied", "email", "hacked", "software", "crashing",
+    "internet", "connection", "driver", "update", "screen", "frozen", "audio", "keyboard",
+]
+
+def synthetic_kb(n_topics: int, seed: int = 7) -> Dict[str, List[str]]:
+    """Random KB in the `load_kb` schema: 2-4 word topics, 3-6 solutions each"""
+    rng = random.Random(seed)
+    vocab = WORDS + [f"term{i}" for i in range(max(0, n_topics // 4))]
+    kb = {}
+    while len(kb) < n_topics:
+        topic = " ".join(rng.sample(vocab, rng.randint(2, 4)))
+        kb[topic] = [f"Step {i + 1} for {topic}" for i in range(rng.randint(3, 6))]
+    return kb
+
+def sample_queries(kb: Dict[str, List[str]], n: int = 200, seed: int = 11) -> List[str]:
+    """Mix of exact topics, partial topics and free text"""
+    rng = random.Random(seed)
+    topics = list(kb)
+    queries = []
+    for i in range(n):
+        words = rng.choice(topics).split()
+        if i % 3 == 0:
+            queries.append(" ".join(words))
+        elif i % 3 == 1:
+            queries.append(" ".join(words[:2] + ["not", "working"]))
+        else:
+            queries.append(" ".join(rng.sample(WORDS, 3)))
+    return queries
+
+def timeit(fn: Callable, args_list: List, repeat: int = 1) -> float:
+    """Mean seconds per call of fn over args_list"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for args in args_list:
+            fn(args)
+    return (time.perf_counter() - start) / (repeat * len(args_list))
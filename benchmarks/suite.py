@@ -0,0 +1,134 @@
+"""
+Reproducible benchmark suite: engine build, search latency, reply throughput,
+KB load/save I/O and import time, written as JSON so runs can be compared
+across commits. Runs headless: the core import never loads Streamlit.
+
+Usage: python benchmarks/suite.py [--sizes 30 1000 ...] [--queries N] [--out results.json]
+"""
+
+import argparse, json, os, platform, random, statistics, subprocess, sys, tempfile, time
+from pathlib import Path
+import common
+from bench_import import HEAVY, importtime
+from Qapp import CONFIG, LLM, QuantumSearch, StageClock, compile_kb, load_kb, save_kb
+
+ROOT = Path(__file__).resolve().parent.parent
+SIZES = [30, 1_000, 10_000, 100_000, 1_000_000]
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+def latency_stats(samples) -> dict:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {
+        "mean_ms": statistics.fmean(samples) * 1e3,
+        "p50_ms": pick(0.50) * 1e3,
+        "p95_ms": pick(0.95) * 1e3,
+        "p99_ms": pick(0.99) * 1e3,
+    }
+
+def import_time(repeat: int = 3) -> dict:
+    """Wall time of `import Qapp` in a fresh interpreter (best of `repeat`)"""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import Qapp"], cwd=ROOT, check=True, capture_output=True)
+        runs.append(time.perf_counter() - start)
+    baseline = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True, capture_output=True)
+        baseline.append(time.perf_counter() - start)
+    modules = {row[0] for row in importtime()}
+    return {
+        "import_ms": min(runs) * 1e3,
+        "interpreter_ms": min(baseline) * 1e3,
+        "heavy_loaded": [m for m in HEAVY if m in modules],
+    }
+
+def bench_size(size: int, n_queries: int, seed: int) -> dict:
+    kb = common.synthetic_kb(size, seed)
+    queries = common.sample_queries(kb, n_queries, seed)
+    result = {"topics": size, "solutions": sum(len(v) for v in kb.values())}
+
+    start = time.perf_counter()
+    qs = QuantumSearch(kb)
+    result["build_ms"] = (time.perf_counter() - start) * 1e3
+
+    qs.search(queries[0])  # Build lazy indexes outside the timed loop
+    # Live noise from seeded RNGs, so rankings (and the work they take) repeat across runs.
+    # Deterministic mode would time its O(topics) reproducible noise instead of the served path.
+    random.seed(seed)
+    if "numpy" in sys.modules:
+        sys.modules["numpy"].random.seed(seed)
+    samples, answers, stages = [], [], {}
+    for q in queries:
+        clock = StageClock()
+        start = time.perf_counter()
+        answers.append(qs.search(q, clock=clock))
+        samples.append(time.perf_counter() - start)
+        for stage, seconds in clock.timings.items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    result["search"] = latency_stats(samples)
+    result["search"]["stages_mean_ms"] = {stage: total * 1e3 / len(queries) for stage, total in stages.items()}
+
+    llm = LLM()
+    start = time.perf_counter()
+    for sols in answers:
+        llm.reply(sols)
+    result["reply_per_s"] = len(answers) / (time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file = os.path.join(tmp, "kb.json")
+        start = time.perf_counter()
+        save_kb(kb, file)
+        result["save_ms"] = (time.perf_counter() - start) * 1e3
+        result["kb_bytes"] = os.path.getsize(file)
+        start = time.perf_counter()
+        load_kb(file, prefer_compiled=False)
+        result["load_ms"] = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        compile_kb(file)
+        result["compile_ms"] = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        compiled = load_kb(file)
+        QuantumSearch(compiled)
+        result["compiled_load_and_build_ms"] = (time.perf_counter() - start) * 1e3
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: CONFIG[k] for k in ("SEARCH_BACKEND", "SEARCH_RERANKER", "CANDIDATE_BUDGET", "FUZZY_MATCHING",
+                                            "QUANTUM_MODE")},
+        "seed": args.seed,
+        "queries": args.queries,
+        "startup": import_time(),
+        "sizes": [],
+    }
+    for size in args.sizes:
+        print(f"Benchmarking {size} topics...", file=sys.stderr)
+        report["sizes"].append(bench_size(size, args.queries, args.seed))
+
+    out = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(out + "\n", encoding="utf8")
+    else:
+        print(out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+In-process tests for the JSON API (ChatService): requests are driven straight
+through the ASGI callable, so no server or network is involved
+
+Usage: python -m pytest tests
+"""
+
+import asyncio, json, sys
+from pathlib import Path
+
+import pytest
+
+# Tests run from the repo root or from this folder
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from Qapp import CONFIG, ChatService, save_kb
+
+KB = {
+    "password reset": ["Use the 'Forgot password' link", "Check your spam folder for the email"],
+    "printer offline": ["Restart the printer", "Clear the print queue", "Reinstall the driver"],
+    "wifi not connecting": ["Restart the router", "Forget and rejoin the network"],
+}
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(CONFIG, "QUANTUM_RANDOMNESS_FACTOR", 0.0)
+    kb_file = str(tmp_path / "knowledge_base.json")
+    save_kb(KB, kb_file)
+    app = ChatService(kb_file, workers=1)
+    yield app
+    app._shutdown_executor()
+
+async def _call(app, method: str, path: str, body: bytes = b""):
+    """One request through the ASGI app: (status, content type, body)"""
+    scope = {"type": "http", "method": method, "path": path, "headers": []}
+    requests = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return requests.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    headers = dict(sent[0]["headers"])
+    return sent[0]["status"], headers[b"content-type"].decode(), sent[1]["body"]
+
+def call(app, method: str, path: str, payload=None, raw: bytes = b""):
+    status, content_type, body = asyncio.run(
+        _call(app, method, path, json.dumps(payload).encode() if payload is not None else raw))
+    return status, json.loads(body) if content_type.startswith("application/json") else body.decode()
+
+def test_search(service):
+    status, body = call(service, "POST", "/search", {"query": "printer offline", "n": 5})
+    assert status == 200
+    assert body["query"] == "printer offline"
+    assert body["results"] == KB["printer offline"]
+
+def test_search_n(service):
+    # `n` counts matched topics: both topics share a word with this query
+    _, one = call(service, "POST", "/search", {"query": "printer not connecting", "n": 1})
+    _, two = call(service, "POST", "/search", {"query": "printer not connecting", "n": 2})
+    assert len(one["results"]) < len(two["results"])
+    assert two["results"][:len(one["results"])] == one["results"]
+
+def test_reply_and_n(service):
+    status, body = call(service, "POST", "/reply", {"query": "printer offline", "n": 1})
+    assert status == 200 and body["status"] == "ok"
+    assert "Restart the printer" in body["reply"]
+
+    # Replies built from a different number of topics are cached separately
+    call(service, "POST", "/reply", {"query": "printer offline", "n": 3})
+    assert len(service.bot.cache.entries) == 2
+    _, again = call(service, "POST", "/reply", {"query": "printer offline", "n": 1})
+    assert again["reply"] == body["reply"]
+    assert service.bot.cache.hits == 1
+
+def test_metrics(service):
+    call(service, "POST", "/search", {"query": "wifi not connecting"})
+    status, text = call(service, "GET", "/metrics")
+    assert status == 200
+    assert "# TYPE qai_searches_total counter" in text
+    assert "qai_queries_total" in text
+
+@pytest.mark.parametrize("raw", [
+    b"not json",
+    b"[1, 2]",
+    b'{"n": 3}',
+    b'{"query": 42}',
+    b'{"query": "printer", "n": 0}',
+    b'{"query": "printer", "n": 101}',
+    b'{"query": "printer", "n": "3"}',
+])
+def test_bad_request(service, raw):
+    status, body = call(service, "POST", "/search", raw=raw)
+    assert status == 400 and "error" in body
+
+def test_wrong_method_and_path(service):
+    assert call(service, "GET", "/search")[0] == 405
+    assert call(service, "GET", "/reply")[0] == 405
+    assert call(service, "POST", "/nowhere", {"query": "printer"})[0] == 404
+
+def test_simulated_failure(service):
+    status, body = call(service, "POST", "/search", {"query": "simulate error"})
+    assert status == 503 and "decoherence" in body["error"]
+    status, body = call(service, "POST", "/reply", {"query": "simulate error"})
+    assert status == 503 and body["status"] == "error"
+
+def test_reply_from_replaced_kb_not_cached(service, tmp_path):
+    search = service._search
+
+    async def search_then_edit(query, n):
+        results = await search(query, n)
+        save_kb({**KB, "printer jammed": ["Open the tray and remove the paper"]}, str(tmp_path / "knowledge_base.json"))
+        return results
+
+    service._search = search_then_edit
+    status, _ = call(service, "POST", "/reply", {"query": "printer offline"})
+    assert status == 200
+    assert not service.bot.cache.entries